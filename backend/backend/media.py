@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    media.py
+# @Time:    2024/03/12
+"""
+媒体文件服务，不依赖DEBUG，可以在生产环境使用
+
+- 文件名带内容哈希（见restaurant_app/storage.py）时返回一年有效期的immutable缓存头，否则使用MEDIA_CACHE_MAX_AGE；
+- 支持ETag/If-None-Match和Last-Modified/If-Modified-Since条件请求，未修改时返回304；
+- 支持单个字节范围的Range请求（返回206），If-Range不匹配时返回完整文件；
+- 客户端支持时优先返回预压缩的.br/.gz文件；
+- 完整文件使用FileResponse返回，WSGI服务器可以通过wsgi.file_wrapper用sendfile零拷贝发送；
+  配置了MEDIA_ACCEL_REDIRECT时改为返回X-Accel-Redirect头，由nginx直接发送文件（包括Range请求）。
+"""
+import mimetypes
+import posixpath
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+CHUNK_SIZE = 64 * 1024
+
+
+def get_etag(stat, encoding=None):
+    # 强校验的ETag必须区分不同的表示，预压缩的文件加上编码后缀
+    suffix = f'-{encoding}' if encoding else ''
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{suffix}"'
+
+
+def get_cache_control(path):
+    if HASHED_NAME_RE.search(path):
+        return IMMUTABLE_CACHE_CONTROL
+    return f'public, max-age={getattr(settings, "MEDIA_CACHE_MAX_AGE", 3600)}'
+
+
+def is_not_modified(request, etag, mtime):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        etags = {value.strip().removeprefix('W/') for value in if_none_match.split(',')}
+        return '*' in etags or etag in etags
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def parse_range(request, etag, size):
+    """
+    解析Range请求头，返回(start, end)，end包含在内；不需要按范围返回时返回None，范围无法满足时抛出ValueError。
+    """
+    header = request.headers.get('Range')
+    if not header:
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range is not None and if_range.strip() != etag:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None  # 多个范围或无法识别的格式，按完整文件返回
+    start, end = match.groups()
+    if start == '':
+        # bytes=-500表示最后500个字节
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError
+    return start, end
+
+
+def iter_range(fullpath, start, length):
+    with open(fullpath, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def find_precompressed(request, fullpath):
+    accept_encoding = request.headers.get('Accept-Encoding', '')
+    for encoding, suffix in PRECOMPRESSED:
+        if encoding in accept_encoding:
+            candidate = fullpath.with_name(fullpath.name + suffix)
+            if candidate.is_file():
+                return encoding, candidate
+    return None, fullpath
+
+
+@require_safe
+def serve_media(request, path):
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = Path(safe_join(settings.MEDIA_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404
+    if not fullpath.is_file():
+        raise Http404
+
+    stat = fullpath.stat()
+    accel_redirect = getattr(settings, 'MEDIA_ACCEL_REDIRECT', None)
+    # Range请求和交给nginx发送的请求使用原文件，其余请求在客户端支持时返回预压缩的文件
+    encoding, sendpath = None, fullpath
+    if not accel_redirect and 'Range' not in request.headers:
+        encoding, sendpath = find_precompressed(request, fullpath)
+    etag = get_etag(stat, encoding)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': get_cache_control(path),
+        'Accept-Ranges': 'bytes',
+        'Vary': 'Accept-Encoding',
+    }
+    if is_not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+        for key, value in headers.items():
+            response[key] = value
+        return response
+
+    content_type = mimetypes.guess_type(str(fullpath))[0] or 'application/octet-stream'
+
+    if accel_redirect:
+        response = HttpResponse(content_type=content_type, headers=headers)
+        # 文件名通常是中文菜名，需要按URL编码，否则Django会把非ASCII的响应头编码为MIME格式，nginx无法识别
+        response['X-Accel-Redirect'] = accel_redirect.rstrip('/') + '/' + quote(path)
+        return response
+
+    try:
+        byte_range = parse_range(request, etag, stat.st_size)
+    except ValueError:
+        return HttpResponse(status=416, headers={'Content-Range': f'bytes */{stat.st_size}'})
+    if byte_range is not None:
+        start, end = byte_range
+        response = StreamingHttpResponse(iter_range(fullpath, start, end - start + 1), status=206,
+                                         content_type=content_type, headers=headers)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Content-Length'] = str(end - start + 1)
+        return response
+
+    response = FileResponse(sendpath.open('rb'), content_type=content_type, headers=headers)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
@@ -84,6 +84,48 @@ DATABASES = {
     }
 }
 
+# 生产环境的SQLite配置：设置环境变量DJANGO_DB_PROFILE=production后启用
+# - WAL模式下读写互不阻塞，synchronous=NORMAL在WAL模式下仍然不会损坏数据库
+# - busy_timeout让写入在数据库被锁定时等待，而不是立即报错database is locked
+# - IMMEDIATE事务一开始就获取写锁，避免并发时读事务升级为写事务失败
+# - CONN_MAX_AGE在多个请求之间复用连接，省去每个请求重新连接和执行PRAGMA的开销
+SQLITE_PRODUCTION = {
+    'ENGINE': 'backend.sqlite3_tuned',
+    'NAME': BASE_DIR / 'db.sqlite3',
+    'CONN_MAX_AGE': 600,
+    'CONN_HEALTH_CHECKS': True,
+    'OPTIONS': {
+        'timeout': 20,
+        'transaction_mode': 'IMMEDIATE',
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 20000,
+            'cache_size': -64000,  # 64MB
+            'mmap_size': 268435456,  # 256MB
+            'temp_store': 'MEMORY',
+        },
+    },
+}
+
+if os.environ.get('DJANGO_DB_PROFILE') == 'production':
+    DATABASES['default'] = SQLITE_PRODUCTION
+
+# 只读副本：设置环境变量DJANGO_DB_REPLICA为副本数据库文件的路径后启用，统计接口从副本读取，写入仍然走default。
+# 副本可以用 python manage.py refresh_sqlite_replica --interval 60 定期从主库备份生成。
+# 运行测试时副本作为default的镜像（TEST.MIRROR），不单独创建测试数据库。
+SQLITE_REPLICA_PATH = os.environ.get('DJANGO_DB_REPLICA')
+if SQLITE_REPLICA_PATH:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{SQLITE_REPLICA_PATH}?mode=ro',  # 以只读方式打开
+        'OPTIONS': {'uri': True, 'timeout': 20},
+        'TEST': {'MIRROR': 'default'},
+    }
+REPLICA_DATABASE = 'replica' if 'replica' in DATABASES else None
+REPLICA_READ_LISTS = False  # 为True时订单和菜品详情的列表接口也从副本读取
+DATABASE_ROUTERS = ['restaurant_app.db_routers.ReplicaRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -125,12 +167,17 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     # Specifying the default authentication classes
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # 与JWTAuthentication相同，认证的用户从缓存中读取
+        'user_info.authentication.CachedJWTAuthentication',
     ],
     # 统一异常处理
     'EXCEPTION_HANDLER': 'backend.utils.custom_exception_handler',
 }
 
+# JWT认证用户的缓存，用户或用户资料变化时立即失效。需要进程间共享的缓存，本地内存缓存时不缓存用户
+AUTH_USER_CACHE_ALIAS = 'default'
+AUTH_USER_CACHE_TIMEOUT = 300  # 秒
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -153,3 +200,41 @@ CORS_ALLOWED_ORIGINS = [
 # 本地静态图片地址配置
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# 订单总价区间统计的默认区间边界，最后一个区间没有上限，也可以通过请求参数buckets指定
+TOTAL_AMOUNT_BUCKETS = [0, 200, 400, 600, 800, 1000, 1200, 1400, 1600, 1800, 2000]
+
+# 统计接口缓存，默认使用本地内存缓存。多进程部署时可以改用文件缓存，例如：
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#         'LOCATION': BASE_DIR / 'cache',
+#     }
+# }
+ANALYTICS_CACHE_ALIAS = 'default'
+ANALYTICS_CACHE_TIMEOUT = 300  # 秒，按时间滚动的统计窗口最多滞后这么久
+ANALYTICS_PARALLEL_QUERIES = True  # 异步统计接口中互相独立的聚合查询是否在线程池中并发执行
+
+# 服务器推送事件（SSE）：没有事件时发送保活注释的间隔、单个连接的最长时间（之后由浏览器重连），以及浏览器的重连间隔
+SSE_KEEPALIVE = 15  # 秒
+SSE_MAX_DURATION = 300  # 秒
+SSE_RETRY_MS = 3000  # 毫秒
+KITCHEN_LONG_POLL_TIMEOUT = 25  # 秒，后厨单长轮询的最长等待时间
+
+# 菜品图片多尺寸版本：各尺寸的最长边（像素），以及上传后生成图片的线程数
+IMAGE_VARIANTS = {'thumbnail': 160, 'card': 480, 'full': 1280}
+IMAGE_VARIANT_WORKERS = 2
+
+# 媒体文件按内容哈希命名，相同内容只存一份
+STORAGES = {
+    'default': {
+        'BACKEND': 'restaurant_app.storage.HashedFileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+# 文件名不带内容哈希的媒体文件的缓存时间（秒），带哈希的文件缓存一年
+MEDIA_CACHE_MAX_AGE = 3600
+# 由nginx发送媒体文件时配置为nginx中internal location的前缀，例如'/protected-media/'
+MEDIA_ACCEL_REDIRECT = None
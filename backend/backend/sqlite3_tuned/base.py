@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    base.py
+# @Time:    2024/03/20
+"""
+适合生产环境并发写入的SQLite数据库后端
+
+在Django自带的sqlite3后端基础上增加两个OPTIONS：
+- pragmas：每个新连接建立后执行的PRAGMA，例如journal_mode=WAL、synchronous=NORMAL、busy_timeout等；
+- transaction_mode：事务的开始方式，设为'IMMEDIATE'时事务一开始就获取写锁。默认的DEFERRED事务先读后写，
+  并发写入时读事务升级为写事务会直接失败（database is locked），不会等待busy_timeout。
+
+用法见settings.py中的SQLITE_PRODUCTION。
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = params.pop('pragmas', {})
+        self.transaction_mode = (params.pop('transaction_mode', None) or 'DEFERRED').upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(f'transaction_mode必须是{TRANSACTION_MODES}中的一个。')
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
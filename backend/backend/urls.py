@@ -15,16 +15,15 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+
+from .media import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('restaurant_app.urls')),
     path('api/', include('user_info.urls')),  # 包括你的应用的URL配置
+    # 添加本地图片media路由，带缓存头、条件请求和Range支持，不依赖DEBUG
+    re_path(rf'^{settings.MEDIA_URL.strip("/")}/(?P<path>.*)$', serve_media),
 ]
-
-# 添加本地图片media路由
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
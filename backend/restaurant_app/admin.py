@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Table, DishCategory, DishUnit, DishImage, Dish, Order, DishDetail, Employee
+from .models import Table, DishCategory, DishUnit, DishImage, Dish, Order, DishDetail, Employee, DailyDishSales
 
 # Register your models here.
 
@@ -11,3 +11,4 @@ admin.site.register(Dish)
 admin.site.register(Order)
 admin.site.register(DishDetail)
 admin.site.register(Employee)
+admin.site.register(DailyDishSales)
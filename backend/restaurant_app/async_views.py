@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    async_views.py
+# @Time:    2024/03/25
+"""
+统计接口的异步版本
+
+DRF的ViewSet只能同步执行，一个慢的聚合查询会一直占用一个工作线程。这里的接口是Django原生的异步视图，
+在ASGI下运行时一个进程的事件循环可以同时处理很多个看板请求。返回的数据与同名的同步接口相同，并共用缓存。
+
+每个统计由几个互相独立的聚合查询组成（例如原始菜品详情和每日销量汇总表），
+settings.ANALYTICS_PARALLEL_QUERIES为True时这些查询在线程池中并发执行，每个线程使用自己的数据库连接，
+执行完毕后关闭；为False时（如测试在事务中运行）使用Django的异步ORM在请求的数据库连接上依次执行。
+
+示例：GET /api/async/dish/sales-rank/?period=day
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.views.decorators.http import require_GET
+
+from .cache import async_cached_analytics
+from .db_routers import read_from_replica
+from .models import Order
+from .views import get_time_range, get_dish_sales_querysets, merge_dish_sales_rank, get_category_sales_querysets, \
+    merge_category_sales_trend, get_total_amount_buckets, get_total_amount_queryset, merge_total_amount_statistics, \
+    format_total_amount_statistics
+
+
+def fetch_rows(queryset):
+    """
+    在线程池的线程中执行查询，返回全部结果并关闭该线程的数据库连接。
+    """
+    try:
+        return list(queryset)
+    finally:
+        connections.close_all()
+
+
+async def fetch_all(querysets):
+    """
+    执行多个互相独立的查询，按顺序返回各查询的结果列表。
+    """
+    if getattr(settings, 'ANALYTICS_PARALLEL_QUERIES', True):
+        return await asyncio.gather(*(sync_to_async(fetch_rows, thread_sensitive=False)(queryset)
+                                      for queryset in querysets))
+    return [[row async for row in queryset] for queryset in querysets]
+
+
+# 菜品销量排行榜，参数与/dish/sales-rank/相同
+@require_GET
+@async_cached_analytics('dish-sales-rank')
+@read_from_replica
+async def dish_sales_rank(request):
+    period = request.GET.get('period', 'day')  # 默认为'day'
+    if period not in ['day', 'week', 'month']:
+        return {'msg': '无效的时间段。'}, 400
+    results = await fetch_all(get_dish_sales_querysets(*get_time_range(period)))
+    return merge_dish_sales_rank(results), 200
+
+
+# 菜品分类销售趋势，参数与/dish-category/sales-rank/相同
+@require_GET
+@async_cached_analytics('dish-category-sales-rank')
+@read_from_replica
+async def category_sales_rank(request):
+    period = request.GET.get('period', 'week')  # 默认为'week'
+    if period not in ['week', 'month']:
+        return {'msg': '无效的时间段。'}, 400
+    results = await fetch_all(get_category_sales_querysets(*get_time_range(period)))
+    return merge_category_sales_trend(results), 200
+
+
+# 订单销售总价区间统计，参数与/order/total-amount-statistics/相同
+@require_GET
+@async_cached_analytics('order-total-amount-statistics')
+@read_from_replica
+async def total_amount_statistics(request):
+    period = request.GET.get('period', 'day')  # 默认为'day'
+    if period not in ['day', 'week', 'month']:
+        return {'msg': '无效的时间段。'}, 400
+    try:
+        edges = get_total_amount_buckets(request.GET.get('buckets'))
+    except ValueError as exc:
+        return {'msg': str(exc)}, 400
+    queryset = Order.objects.filter(transaction_time__range=get_time_range(period))
+    rows, = await fetch_all([get_total_amount_queryset(queryset, edges)])
+    return format_total_amount_statistics(merge_total_amount_statistics(rows, edges)), 200
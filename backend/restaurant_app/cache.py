@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    cache.py
+# @Time:    2024/02/26
+"""
+统计接口的响应缓存
+
+缓存键包含接口名称、请求参数和数据版本号。DishDetail、Order等数据发生变化时由models.py中的信号递增版本号，
+旧版本的缓存自然失效，因此数据没有变化时统计结果可以一直从缓存返回。
+版本号和命中/未命中计数都保存在Django缓存中，可以使用本地内存缓存或文件缓存等后端，多个进程共享文件缓存时同样有效。
+版本号每次写入新值而不是用incr递增，在incr不是原子操作的后端上并发修改也不会漏掉失效；
+命中/未命中计数只用于观察，在这些后端上并发时可能少计。
+
+基础数据接口的ETag同样基于版本号：每个模型有自己的版本号，在保存和删除时递增，
+客户端携带的If-None-Match与当前ETag一致时直接返回304，不查询数据库也不做序列化。
+"""
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_KEY = 'analytics:version'
+HITS_KEY = 'analytics:hits'
+MISSES_KEY = 'analytics:misses'
+
+
+def get_cache():
+    return caches[getattr(settings, 'ANALYTICS_CACHE_ALIAS', 'default')]
+
+
+def incr(key):
+    """
+    递增缓存中的计数器，计数器不存在时从1开始。
+    """
+    cache = get_cache()
+    if cache.add(key, 1, timeout=None):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # 计数器在add和incr之间被清除
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+def get_version(key):
+    """
+    返回缓存中的版本号。版本号不存在时以当前时间（纳秒）初始化，
+    这样缓存被清空或淘汰后也不会与之前使用过的版本号重复。
+    """
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_version(key):
+    """
+    在当前事务提交后把版本号更新为一个新值（当前时间的纳秒数，至少比原值大1）。
+    文件缓存和数据库缓存的incr是先读后写，并发的两次递增可能只生效一次，旧版本的缓存会一直保留到过期；
+    这里每次写入由当前时间得到的新值，并发时无论哪次写入最后生效，版本号都与之前的不同。
+    """
+    def bump():
+        cache = get_cache()
+        cache.set(key, max(time.time_ns(), (cache.get(key) or 0) + 1), timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def get_data_version():
+    return get_version(VERSION_KEY)
+
+
+def bump_data_version():
+    """
+    在当前事务提交后递增数据版本号，使所有统计接口的缓存失效。
+    """
+    bump_version(VERSION_KEY)
+
+
+def get_model_version(model):
+    return get_version(f'model-version:{model._meta.label_lower}')
+
+
+def bump_model_version(model):
+    """
+    在当前事务提交后递增模型的版本号，使基于该模型生成的ETag失效。
+    """
+    bump_version(f'model-version:{model._meta.label_lower}')
+
+
+def get_cache_stats():
+    """
+    返回统计接口缓存的命中次数、未命中次数和当前数据版本号。
+    """
+    cache = get_cache()
+    return {
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+        'version': get_data_version(),
+    }
+
+
+def make_cache_key(name, query_params):
+    params = '&'.join(f'{key}={",".join(query_params.getlist(key))}' for key in sorted(query_params))
+    digest = hashlib.md5(params.encode('utf-8')).hexdigest()
+    return f'analytics:{name}:{get_data_version()}:{digest}'
+
+
+def get_cached_analytics(name, query_params):
+    """
+    查找统计接口的缓存并记录命中或未命中，返回(缓存键, 缓存的数据)，未命中时数据为None。
+    """
+    key = make_cache_key(name, query_params)
+    data = get_cache().get(key)
+    incr(HITS_KEY if data is not None else MISSES_KEY)
+    return key, data
+
+
+def set_cached_analytics(key, data):
+    get_cache().set(key, data, timeout=getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 300))
+
+
+def cached_analytics(name):
+    """
+    统计接口的缓存装饰器，用于ViewSet的action。只缓存状态码为200的响应，
+    响应头X-Cache表示本次请求是否命中缓存。
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, request, *args, **kwargs):
+            key, data = get_cached_analytics(name, request.query_params)
+            if data is not None:
+                return Response(data, headers={'X-Cache': 'HIT'})
+
+            response = func(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                set_cached_analytics(key, response.data)
+            response['X-Cache'] = 'MISS'
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def async_cached_analytics(name):
+    """
+    cached_analytics的异步版本，用于返回(数据, 状态码)的异步视图函数，与同名的同步接口共用缓存。
+    """
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(request, *args, **kwargs):
+            key, data = await sync_to_async(get_cached_analytics)(name, request.GET)
+            if data is not None:
+                return JsonResponse(data, safe=False, headers={'X-Cache': 'HIT'})
+
+            data, status_code = await func(request, *args, **kwargs)
+            if status_code == 200:
+                await sync_to_async(set_cached_analytics)(key, data)
+            return JsonResponse(data, safe=False, status=status_code, headers={'X-Cache': 'MISS'})
+
+        return wrapper
+
+    return decorator
+
+
+def parse_etags(header):
+    """
+    解析If-None-Match请求头，返回去掉弱校验前缀W/的ETag集合。
+    """
+    return {etag.strip().removeprefix('W/') for etag in header.split(',') if etag.strip()}
+
+
+class ConditionalListMixin:
+    """
+    为ViewSet的list接口提供ETag和If-None-Match条件请求支持。
+    ETag由etag_models中各模型的版本号、请求的host和完整路径计算得出，
+    因此任何一个模型发生变化或请求参数（如分页）不同时ETag都会不同。
+    """
+    etag_models = ()
+
+    def get_list_etag(self, request):
+        versions = ':'.join(f'{model._meta.label_lower}={get_model_version(model)}' for model in self.etag_models)
+        value = f'{versions}|{request.get_host()}|{request.get_full_path()}'
+        return f'"{hashlib.md5(value.encode("utf-8")).hexdigest()}"'
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_list_etag(request)
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+        return response
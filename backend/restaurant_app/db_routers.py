@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    db_routers.py
+# @Time:    2024/03/22
+"""
+读写分离的数据库路由
+
+统计接口要扫描大量的订单和菜品详情，和下单写入在同一个数据库上会互相拖慢。配置了只读副本时
+（DATABASES中的replica，通过settings.REPLICA_DATABASE指定别名），用read_from_replica标记的接口从副本读取，
+其他读取和所有写入仍然走主库default。
+
+以下情况即使在标记的接口中也从主库读取，保证读到自己刚写入的数据：
+- 主库上有未提交的事务（例如在transaction.atomic中）；
+- 当前请求已经写入过数据。
+
+副本可以是定期从主库备份的SQLite文件，见refresh_sqlite_replica命令。副本的数据会比主库滞后一个刷新周期，
+因此只用于可以接受短暂滞后的统计和列表接口。
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# 当前上下文是否允许从副本读取；None表示不允许，否则为{'wrote': 是否已经写入过数据}
+_replica_state = ContextVar('replica_state', default=None)
+
+
+def get_replica_alias():
+    return getattr(settings, 'REPLICA_DATABASE', None)
+
+
+@contextmanager
+def use_replica():
+    """
+    在with块中允许从只读副本读取。
+    """
+    token = _replica_state.set({'wrote': False})
+    try:
+        yield
+    finally:
+        _replica_state.reset(token)
+
+
+def read_from_replica(func):
+    """
+    视图方法的装饰器，使该接口的读取走只读副本，同时支持同步和异步视图。
+    """
+    if iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            with use_replica():
+                return await func(*args, **kwargs)
+
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+# 列表接口是否也从副本读取由settings.REPLICA_READ_LISTS控制，默认关闭
+class ReplicaListMixin:
+
+    def list(self, request, *args, **kwargs):
+        if getattr(settings, 'REPLICA_READ_LISTS', False):
+            with use_replica():
+                return super().list(request, *args, **kwargs)
+        return super().list(request, *args, **kwargs)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        alias = get_replica_alias()
+        state = _replica_state.get()
+        if not alias or state is None or state['wrote']:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        state = _replica_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本和主库是同一份数据
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 副本的表结构随备份从主库复制，不在副本上执行迁移
+        if db == get_replica_alias():
+            return False
+        return None
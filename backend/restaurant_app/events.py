@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    events.py
+# @Time:    2024/03/29
+"""
+进程内的消息广播和服务器推送事件（SSE）
+
+Broadcaster把发布的事件复制到每个订阅者自己的队列中，数据变化时由信号在事务提交后发布，
+每个SSE连接订阅一次，收到事件后推送给浏览器，代替客户端轮询。
+
+同步订阅者（WSGI下每个连接占用一个线程）使用queue.Queue，异步订阅者（ASGI下在事件循环中等待）使用asyncio.Queue，
+发布者可以在任意线程中调用publish。订阅者的队列满时（客户端处理太慢）丢弃后续事件并标记overflowed，
+推送时改为重新发送一次完整的快照。
+
+广播只在当前进程内有效：多进程部署时，一个进程中的写入不会通知到连接在其他进程上的客户端，
+需要部署为单个进程（例如一个ASGI worker），或者改用Redis等跨进程的消息服务。
+"""
+import asyncio
+import json
+import queue
+import threading
+import time
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+DEFAULT_QUEUE_SIZE = 1000
+MESSAGE_CHUNK_SIZE = 100  # 异步推送时每次在线程中生成的消息数量
+
+
+class Subscription:
+    """
+    同步订阅者，在WSGI的工作线程中阻塞等待事件。
+    """
+
+    def __init__(self, broadcaster, maxsize):
+        self.broadcaster = broadcaster
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """
+        返回下一个事件，超时返回None。
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broadcaster.unsubscribe(self)
+
+
+class AsyncSubscription(Subscription):
+    """
+    异步订阅者，在事件循环中等待事件，不占用线程。
+    """
+
+    def __init__(self, broadcaster, maxsize):
+        self.broadcaster = broadcaster
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, event):
+        # 发布者可能在其他线程中，需要交给订阅者的事件循环放入队列
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Broadcaster:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self, maxsize=DEFAULT_QUEUE_SIZE):
+        return self._add(Subscription(self, maxsize))
+
+    def subscribe_async(self, maxsize=DEFAULT_QUEUE_SIZE):
+        return self._add(AsyncSubscription(self, maxsize))
+
+    def _add(self, subscription):
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.put(event)
+            except RuntimeError:
+                # 异步订阅者的事件循环已经关闭
+                self.unsubscribe(subscription)
+
+
+def format_sse(data, event=None, event_id=None):
+    """
+    按SSE协议格式化一条消息，data序列化为JSON。
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+# 让DRF的内容协商接受EventSource发送的Accept: text/event-stream，出错时返回JSON格式的错误信息
+class EventStreamRenderer(BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False).encode(self.charset)
+
+
+def iter_events(broadcaster, snapshot, changes, keepalive, deadline):
+    """
+    同步的事件流：先订阅再发送snapshot()返回的消息，快照之后发生的变化都不会漏掉；之后每收到一个事件
+    发送changes(event)返回的消息，没有事件时定期发送注释保持连接，到达deadline后结束，由浏览器自动重连。
+    snapshot和changes可以返回生成器，消息逐条发送，不需要先全部生成。
+    """
+    subscription = broadcaster.subscribe()
+    try:
+        yield f'retry: {getattr(settings, "SSE_RETRY_MS", 3000)}\n\n'
+        yield from snapshot()
+        while time.monotonic() < deadline:
+            event = subscription.get(timeout=min(keepalive, max(0, deadline - time.monotonic())))
+            if subscription.overflowed:
+                subscription.overflowed = False
+                yield from snapshot()
+            elif event is None:
+                yield ': keepalive\n\n'
+            else:
+                yield from changes(event)
+    finally:
+        subscription.close()
+
+
+async def aiter_messages(func, *args):
+    """
+    在线程中调用同步的消息函数func(*args)，每次从返回的迭代器中取出MESSAGE_CHUNK_SIZE条消息，
+    func返回生成器时按需查询，不会一次生成全部消息。
+    """
+    messages = await sync_to_async(lambda: iter(func(*args)))()
+    while True:
+        chunk = await sync_to_async(lambda: list(islice(messages, MESSAGE_CHUNK_SIZE)))()
+        if not chunk:
+            return
+        for message in chunk:
+            yield message
+
+
+async def aiter_events(broadcaster, snapshot, changes, keepalive, deadline):
+    """
+    iter_events的异步版本，snapshot和changes是同步函数，可能查询数据库，在线程中执行。
+    """
+    subscription = broadcaster.subscribe_async()
+    try:
+        yield f'retry: {getattr(settings, "SSE_RETRY_MS", 3000)}\n\n'
+        async for message in aiter_messages(snapshot):
+            yield message
+        while time.monotonic() < deadline:
+            event = await subscription.get(timeout=min(keepalive, max(0, deadline - time.monotonic())))
+            if subscription.overflowed:
+                subscription.overflowed = False
+                messages = aiter_messages(snapshot)
+            elif event is None:
+                yield ': keepalive\n\n'
+                continue
+            else:
+                messages = aiter_messages(changes, event)
+            async for message in messages:
+                yield message
+    finally:
+        subscription.close()
+
+
+def event_stream_response(request, broadcaster, snapshot, changes):
+    """
+    返回SSE响应。snapshot()生成连接建立和消息积压时发送的完整数据，changes(event)把一个广播事件转换为要发送的消息。
+    ASGI下使用异步迭代器，连接等待事件时不占用线程；WSGI下使用同步迭代器，每个连接占用一个工作线程。
+    连接最长保持settings.SSE_MAX_DURATION秒。
+    """
+    keepalive = getattr(settings, 'SSE_KEEPALIVE', 15)
+    deadline = time.monotonic() + getattr(settings, 'SSE_MAX_DURATION', 300)
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        content = aiter_events(broadcaster, snapshot, changes, keepalive, deadline)
+    else:
+        content = iter_events(broadcaster, snapshot, changes, keepalive, deadline)
+    response = StreamingHttpResponse(content, content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # 禁止nginx缓冲，事件立即发送给客户端
+    return response
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    export.py
+# @Time:    2024/03/05
+"""
+订单导出
+
+订单和菜品详情通过一条LEFT JOIN查询按订单顺序取出，使用iterator()分块读取，逐行生成CSV或NDJSON，
+配合StreamingHttpResponse边查询边输出，内存占用与导出的时间范围无关。
+"""
+import csv
+import json
+from itertools import groupby
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+ORDER_FIELDS = ('id', 'transaction_time', 'table__table_number', 'number_of_people', 'total_amount',
+                'transaction_status')
+DISH_DETAIL_FIELDS = ('dishdetail__id', 'dishdetail__name', 'dishdetail__unit', 'dishdetail__specification',
+                      'dishdetail__unit_price', 'dishdetail__quantity', 'dishdetail__total_price',
+                      'dishdetail__order_time')
+
+CSV_HEADER = ('order_id', 'transaction_time', 'table_number', 'number_of_people', 'total_amount',
+              'transaction_status', 'dish_detail_id', 'name', 'unit', 'specification', 'unit_price', 'quantity',
+              'total_price',
+              'order_time')
+
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    """
+    实现了write方法的伪文件对象，csv.writer写入时直接返回该行内容。
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_export_rows(queryset):
+    """
+    将订单查询集展开为（订单 + 菜品详情）的行，没有菜品详情的订单也会输出一行。
+    """
+    return queryset.prefetch_related(None) \
+        .order_by('-transaction_time', '-id', 'dishdetail__id') \
+        .values_list(*ORDER_FIELDS, *DISH_DETAIL_FIELDS) \
+        .iterator(chunk_size=CHUNK_SIZE)
+
+
+def format_datetime(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value is not None else None
+
+
+def stream_csv(queryset):
+    writer = csv.writer(Echo())
+    yield '\ufeff'  # BOM，方便Excel正确识别中文
+    yield writer.writerow(CSV_HEADER)
+    for row in iter_export_rows(queryset):
+        row = list(row)
+        row[1] = format_datetime(row[1])
+        row[-1] = format_datetime(row[-1])
+        yield writer.writerow(row)
+
+
+def stream_ndjson(queryset):
+    """
+    每个订单输出一行JSON，菜品详情嵌套在dish_details中。
+    查询结果按订单排序，同一订单的行是连续的，因此每次只需要在内存中保留一个订单。
+    """
+    order_size = len(ORDER_FIELDS)
+    for _, rows in groupby(iter_export_rows(queryset), key=lambda row: row[0]):
+        rows = list(rows)
+        order = dict(zip(CSV_HEADER[:order_size], rows[0][:order_size]))
+        order['transaction_time'] = format_datetime(order['transaction_time'])
+        order['dish_details'] = []
+        for row in rows:
+            if row[order_size] is None:  # 没有菜品详情的订单
+                continue
+            detail = dict(zip(CSV_HEADER[order_size:], row[order_size:]))
+            detail['order_time'] = format_datetime(detail['order_time'])
+            order['dish_details'].append(detail)
+        yield json.dumps(order, ensure_ascii=False, cls=DjangoJSONEncoder) + '\n'
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    images.py
+# @Time:    2024/03/08
+"""
+菜品图片的多尺寸版本
+
+上传的原图通常是几MB的相机照片，直接发给每个桌位的平板太重。这里用Pillow为每张图片生成
+thumbnail、card、full三种尺寸，每种尺寸都有WebP和JPEG两种格式（JPEG作为不支持WebP的浏览器的后备），
+生成的文件路径保存在DishImage.variants中，例如：
+    {"thumbnail": {"webp": "images/variants/糖醋里脊_thumbnail.1a2b3c4d5e6f.webp", "jpeg": "images/variants/糖醋里脊_thumbnail.7a8b9c0d1e2f.jpg"}}
+重新生成时（例如更换了原图）不再使用的旧版本文件会被删除。
+
+上传图片后在线程池中生成，不阻塞上传请求；Pillow在解码、缩放和编码时会释放GIL，线程池可以并行利用多个CPU核。
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from os.path import basename, splitext
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+# 各尺寸的最长边（像素）
+DEFAULT_IMAGE_VARIANTS = {'thumbnail': 160, 'card': 480, 'full': 1280}
+VARIANT_DIR = 'images/variants'
+
+_executor = None
+
+
+def get_variant_sizes():
+    return getattr(settings, 'IMAGE_VARIANTS', DEFAULT_IMAGE_VARIANTS)
+
+
+def get_variant_formats():
+    # (格式名称, Pillow格式, 文件扩展名, 保存参数)
+    formats = [('jpeg', 'JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True})]
+    if features.check('webp'):
+        formats.insert(0, ('webp', 'WEBP', 'webp', {'quality': 80, 'method': 4}))
+    return formats
+
+
+def render_variants(name, storage=default_storage):
+    """
+    读取存储中的原图name，生成全部尺寸和格式的图片并写入存储，返回各版本的文件路径。
+    """
+    with storage.open(name, 'rb') as file:
+        image = Image.open(file)
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGB')
+
+    stem = splitext(basename(name))[0]
+    variants = {}
+    for variant, size in get_variant_sizes().items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        variants[variant] = {}
+        for format_name, pil_format, extension, options in get_variant_formats():
+            buffer = BytesIO()
+            resized.save(buffer, format=pil_format, **options)
+            path = f'{VARIANT_DIR}/{stem}_{variant}.{extension}'
+            variants[variant][format_name] = storage.save(path, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def get_variant_paths(variants):
+    return {path for formats in variants.values() for path in formats.values()}
+
+
+def delete_stale_variants(old_variants, storage=default_storage):
+    """
+    在保存新的多尺寸版本之后，删除old_variants（若干张图片原来的variants）中已经没有图片引用的文件。
+    文件名带内容哈希，内容相同的图片共用同一个文件，仍被任何菜品图片引用的文件不删除。
+    """
+    from .models import DishImage
+
+    stale = set().union(*(get_variant_paths(variants) for variants in old_variants))
+    if not stale:
+        return
+    for variants in DishImage.objects.exclude(variants={}).values_list('variants', flat=True):
+        stale -= get_variant_paths(variants)
+    for path in stale:
+        storage.delete(path)
+
+
+def generate_variants(image_id, in_worker=False):
+    """
+    为指定的DishImage生成多尺寸版本并保存路径。在线程池中执行时（in_worker=True）使用线程自己的数据库连接，执行完毕后关闭。
+    """
+    from .cache import bump_model_version
+    from .models import DishImage
+
+    try:
+        name, old_variants = DishImage.objects.filter(pk=image_id).values_list('file', 'variants').first() \
+            or (None, None)
+        if not name:
+            return None
+        variants = render_variants(name)
+        DishImage.objects.filter(pk=image_id).update(variants=variants)
+        delete_stale_variants([old_variants or {}])
+        # update()不会触发信号，手动使菜单的ETag失效
+        bump_model_version(DishImage)
+        return variants
+    except Exception:
+        logger.exception('生成菜品图片%s的多尺寸版本失败', image_id)
+        raise
+    finally:
+        if in_worker:
+            close_old_connections()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2),
+                                       thread_name_prefix='dish-image')
+    return _executor
+
+
+def schedule_variants(image_id):
+    """
+    上传图片后生成多尺寸版本。IMAGE_VARIANTS_ASYNC为False时（如测试）直接在当前线程生成。
+    """
+    if getattr(settings, 'IMAGE_VARIANTS_ASYNC', True):
+        return get_executor().submit(generate_variants, image_id, in_worker=True)
+    return generate_variants(image_id)
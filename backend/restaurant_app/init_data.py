@@ -44,8 +44,9 @@ def create_data():
     print("Dish data created.")
 
     for i in range(random.randint(20, 101)):
+        # total_amount由菜品详情的信号累加
         order = Order.objects.create(table=Table.objects.order_by('?').first(), number_of_people=random.randint(1, 10),
-                                     total_amount=random.randint(10, 2000), transaction_status='未结账')
+                                     transaction_status='未结账')
         for j in range(random.randint(1, 31)):
             dish = Dish.objects.order_by('?').first()
             if dish is not None:  # 检查是否有Dish对象
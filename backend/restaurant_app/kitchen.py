@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    kitchen.py
+# @Time:    2024/03/30
+"""
+后厨出单：按id游标读取新下单的菜品详情
+
+每条菜品详情是一张后厨单，游标是客户端已经收到的最后一条菜品详情的id。每次读取只执行一条
+id > 游标 的查询（走主键索引），带出菜品名称、单位、规格（下单时的快照）、桌号和数量，不需要重新列出全部菜品详情。
+菜品详情的id单调递增，SQLite的写入是串行的，提交的顺序与id的顺序一致，所以从游标继续读取既不会重复也不会遗漏。
+
+新的菜品详情提交后，通过kitchen_channel发布一个唤醒事件（不携带数据），等待中的长轮询和SSE连接收到后
+从各自的游标继续查询。与桌位状态推送一样，广播只在当前进程内有效。
+"""
+from django.db import transaction
+from django.db.models import F
+
+from .events import Broadcaster, format_sse
+
+TICKET_BATCH_SIZE = 100
+
+kitchen_channel = Broadcaster()
+
+
+def get_tickets(after, limit=None):
+    """
+    返回id大于after的菜品详情，按id排列，最多limit条（默认TICKET_BATCH_SIZE）。
+    """
+    from .models import DishDetail
+
+    limit = limit or TICKET_BATCH_SIZE
+
+    return list(DishDetail.objects.filter(id__gt=after).order_by('id').values(
+        'id', 'order_id', 'quantity', 'order_time', 'name', 'unit', 'specification',
+        table_number=F('order__table__table_number'),
+    )[:limit])
+
+
+def get_latest_ticket_id():
+    from .models import DishDetail
+
+    return DishDetail.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def schedule_kitchen_wakeup():
+    """
+    在当前事务提交后唤醒等待新后厨单的客户端。
+    """
+    def publish():
+        if kitchen_channel.subscriber_count:
+            kitchen_channel.publish(True)
+
+    transaction.on_commit(publish)
+
+
+def wait_for_tickets(after, timeout):
+    """
+    长轮询：有新的后厨单时立即返回，否则最多等待timeout秒。先订阅再查询，查询之后提交的菜品详情也会唤醒等待。
+    """
+    subscription = kitchen_channel.subscribe()
+    try:
+        tickets = get_tickets(after)
+        if tickets:
+            return tickets
+        if subscription.get(timeout=timeout) is None and not subscription.overflowed:
+            return []
+        return get_tickets(after)
+    finally:
+        subscription.close()
+
+
+def ticket_messages(after):
+    """
+    返回SSE使用的消息函数：每次调用生成从上次发送的最后一条后厨单之后的消息，每张后厨单是一条ticket事件，
+    事件id是菜品详情的id，浏览器重连时通过Last-Event-ID请求头带回，从断开的位置继续。
+    消息按需生成，每取完一批才查询下一批，从很早的游标重连时也不会把积压的后厨单一次读入内存。
+    """
+    cursor = after
+
+    def fetch(event=None):
+        nonlocal cursor
+        while True:
+            tickets = get_tickets(cursor)
+            for ticket in tickets:
+                cursor = ticket['id']
+                yield format_sse(ticket, event='ticket', event_id=ticket['id'])
+            if len(tickets) < TICKET_BATCH_SIZE:
+                return
+
+    return fetch
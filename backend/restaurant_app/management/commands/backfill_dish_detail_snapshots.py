@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    backfill_dish_detail_snapshots.py
+# @Time:    2024/04/01
+"""
+为添加快照字段之前的菜品详情回填菜品名称、单位、规格和单价
+
+单价优先使用下单时记录的total_price / quantity，没有总价时使用菜品当前的单价；
+名称、单位和规格取自菜品当前的数据。菜品已被删除的菜品详情无法回填，会输出数量。
+
+用法：
+    python manage.py makemigrations restaurant_app && python manage.py migrate
+    python manage.py backfill_dish_detail_snapshots            # 回填
+    python manage.py backfill_dish_detail_snapshots --dry-run  # 只统计需要回填的数量
+"""
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from restaurant_app.models import DishDetail
+
+CENT = Decimal('0.01')
+
+
+class Command(BaseCommand):
+    help = '为没有快照的菜品详情回填菜品名称、单位、规格和单价'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='只输出需要回填的数量，不写入数据库')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批更新的菜品详情数量')
+
+    def handle(self, *args, **options):
+        pending = DishDetail.objects.filter(unit_price__isnull=True)
+        orphaned = pending.filter(dish__isnull=True).count()
+        rows = pending.filter(dish__isnull=False).order_by('id').values_list(
+            'id', 'quantity', 'total_price', 'dish__name', 'dish__unit__unit', 'dish__specification', 'dish__price')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'共{rows.count()}条菜品详情需要回填（未回填）。'))
+        else:
+            updated = 0
+            batch = []
+            for row in rows.iterator(chunk_size=options['batch_size']):
+                batch.append(self.build_snapshot(*row))
+                if len(batch) >= options['batch_size']:
+                    updated += self.save(batch)
+                    batch = []
+            if batch:
+                updated += self.save(batch)
+            self.stdout.write(self.style.SUCCESS(f'已回填{updated}条菜品详情的快照。'))
+        if orphaned:
+            self.stdout.write(self.style.WARNING(f'{orphaned}条菜品详情的菜品已被删除，无法回填。'))
+
+    @staticmethod
+    def build_snapshot(detail_id, quantity, total_price, name, unit, specification, price):
+        if total_price is not None and quantity:
+            price = (total_price / quantity).quantize(CENT)
+        return DishDetail(id=detail_id, name=name, unit=unit, specification=specification, unit_price=price)
+
+    @staticmethod
+    def save(batch):
+        # bulk_update不会触发信号，不影响订单总价和每日销量汇总
+        with transaction.atomic():
+            DishDetail.objects.bulk_update(batch, ['name', 'unit', 'specification', 'unit_price'])
+        return len(batch)
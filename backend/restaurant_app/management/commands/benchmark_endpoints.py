@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    benchmark_endpoints.py
+# @Time:    2024/03/18
+"""
+接口性能基准测试
+
+为每个数据规模创建一个临时数据库（与运行测试时相同，不影响正式数据库），用generate_load_data生成数据，
+然后通过DRF的测试客户端依次请求所有路由注册的ViewSet的list、retrieve和GET类型的自定义action，
+记录每个接口的p50/p95耗时和SQL查询次数，写入JSON报告。
+指定--baseline时与之前保存的报告比较，任何接口的p95耗时超过阈值或查询次数增加都视为性能退化，命令以错误退出。
+
+用法：
+    python manage.py benchmark_endpoints --scales small,medium --output bench.json
+    python manage.py benchmark_endpoints --baseline benchmarks/baseline.json --threshold 0.25
+    python manage.py benchmark_endpoints --output benchmarks/baseline.json   # 更新基准
+"""
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from io import StringIO
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from restaurant_app.urls import router as restaurant_router
+from user_info.urls import router as user_router
+
+# 各数据规模传给generate_load_data的参数
+SCALES = {
+    'tiny': {'tables': 3, 'days': 7, 'dishes': 20, 'employees': 10},
+    'small': {'tables': 10, 'days': 30, 'dishes': 60, 'employees': 30},
+    'medium': {'tables': 30, 'days': 90, 'dishes': 120, 'employees': 100},
+    'large': {'tables': 50, 'days': 365, 'dishes': 200, 'employees': 300},
+}
+
+# 自定义action需要的请求参数
+ACTION_PARAMS = {
+    'sales-rank': {'period': 'month'},
+    'total-amount-statistics': {'period': 'month'},
+    'export': {'type': 'ndjson'},
+    'tickets': {'timeout': 0},  # 后厨单长轮询，不等待新的后厨单
+}
+
+
+def is_event_stream(extra_action):
+    """
+    SSE推送接口的响应要保持连接到SSE_MAX_DURATION才结束，不参与基准测试。
+    """
+    renderer_classes = extra_action.kwargs.get('renderer_classes', ())
+    return any(renderer.media_type == 'text/event-stream' for renderer in renderer_classes)
+
+
+def get_endpoints():
+    """
+    从路由中收集需要测试的接口，返回[(接口名称, url或url模板, 参数, 模型), ...]。
+    retrieve接口的url中的{pk}在运行时替换为该模型的第一条数据的主键。
+    """
+    endpoints = []
+    for router in (restaurant_router, user_router):
+        for prefix, viewset, basename in router.registry:
+            name = basename or prefix
+            model = getattr(getattr(viewset, 'queryset', None), 'model', None)
+            if hasattr(viewset, 'list'):
+                endpoints.append((f'{name}-list', f'/api/{prefix}/', {}, None))
+            if hasattr(viewset, 'retrieve') and model is not None:
+                endpoints.append((f'{name}-detail', f'/api/{prefix}/{{pk}}/', {}, model))
+            for extra_action in viewset.get_extra_actions():
+                if 'get' not in extra_action.mapping or is_event_stream(extra_action):
+                    continue
+                url_path = extra_action.url_path
+                url = f'/api/{prefix}/{{pk}}/{url_path}/' if extra_action.detail else f'/api/{prefix}/{url_path}/'
+                endpoints.append((f'{name}-{url_path}', url, ACTION_PARAMS.get(url_path, {}),
+                                  model if extra_action.detail else None))
+    return endpoints
+
+
+def percentile(values, percent):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[percent - 1]
+
+
+def load_baseline(path):
+    """
+    读取基准报告。文件不存在或不是本命令输出的报告时抛出CommandError，在运行耗时的基准测试之前就报错。
+    """
+    try:
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)
+    except OSError as exc:
+        raise CommandError(f'无法读取基准报告{path}：{exc}')
+    except ValueError as exc:
+        raise CommandError(f'基准报告{path}不是有效的JSON：{exc}')
+    if not isinstance(baseline, dict) or not isinstance(baseline.get('results'), dict):
+        raise CommandError(f'基准报告{path}缺少results。')
+    return baseline
+
+
+class Command(BaseCommand):
+    help = '对所有接口进行不同数据规模下的性能基准测试，并与基准报告比较'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='small,medium', help=f'数据规模，可选{list(SCALES)}，以逗号分隔')
+        parser.add_argument('--repeat', type=int, default=20, help='每个接口请求的次数')
+        parser.add_argument('--seed', type=int, default=0, help='生成数据的随机数种子')
+        parser.add_argument('--output', help='JSON报告的输出路径')
+        parser.add_argument('--baseline', help='用于比较的基准报告路径')
+        parser.add_argument('--threshold', type=float, default=0.25, help='p95耗时允许增加的比例')
+        parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                            help='p95耗时增加小于该毫秒数时不视为退化，避免很快的接口因抖动误报')
+
+    def handle(self, *args, **options):
+        scales = [scale.strip() for scale in options['scales'].split(',') if scale.strip()]
+        unknown = [scale for scale in scales if scale not in SCALES]
+        if unknown:
+            raise CommandError(f'未知的数据规模：{unknown}')
+        baseline = load_baseline(options['baseline']) if options['baseline'] else None
+
+        report = {
+            'meta': {
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'repeat': options['repeat'],
+                'seed': options['seed'],
+            },
+            'results': {},
+        }
+        # 临时数据库只创建在default上，统计接口也要从这里读取，而不是配置的只读副本
+        with override_settings(REPLICA_DATABASE=None):
+            for scale in scales:
+                report['results'][scale] = self.run_scale(scale, options)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'报告已写入{options["output"]}。')
+
+        if baseline is not None:
+            regressions = self.compare(baseline, report, options['threshold'], options['min_delta_ms'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(regression)
+                raise CommandError(f'{len(regressions)}个接口性能退化。')
+            self.stdout.write(self.style.SUCCESS('与基准相比没有性能退化。'))
+
+    def run_scale(self, scale, options):
+        if connection.vendor == 'sqlite':
+            # 使用临时文件而不是内存数据库，更接近实际部署，且每个规模的数据互不影响
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.gettempdir(), f'benchmark_{scale}.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(f'[{scale}] 生成数据...')
+            params = [f'--{key}={value}' for key, value in SCALES[scale].items()]
+            call_command('generate_load_data', f'--seed={options["seed"]}', *params, stdout=StringIO())
+            user = User.objects.create_superuser('benchmark', password='benchmark')
+            client = APIClient()
+            client.force_authenticate(user)
+
+            results = {}
+            for name, url, query, model in get_endpoints():
+                if model is not None:
+                    pk = model.objects.order_by('pk').values_list('pk', flat=True).first()
+                    if pk is None:
+                        continue
+                    url = url.format(pk=pk)
+                results[name] = self.measure(client, url, query, options['repeat'])
+                self.stdout.write(f'[{scale}] {name}: p50={results[name]["p50_ms"]}ms '
+                                  f'p95={results[name]["p95_ms"]}ms queries={results[name]["queries"]}')
+            return results
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def measure(self, client, url, query, repeat):
+        timings, queries, status_code = [], 0, None
+        for _ in range(repeat):
+            cache.clear()  # 每次都测量未命中缓存时的耗时
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(url, query)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+                timings.append((time.perf_counter() - started) * 1000)
+            queries, status_code = len(captured), response.status_code
+        return {
+            'url': url,
+            'status': status_code,
+            'queries': queries,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+        }
+
+    def compare(self, baseline, report, threshold, min_delta_ms):
+        regressions = []
+        for scale, results in report['results'].items():
+            for name, current in results.items():
+                previous = baseline.get('results', {}).get(scale, {}).get(name)
+                if previous is None:
+                    continue
+                if current['queries'] > previous['queries']:
+                    regressions.append(f'[{scale}] {name}: 查询次数 {previous["queries"]} -> {current["queries"]}')
+                limit = previous['p95_ms'] * (1 + threshold)
+                if current['p95_ms'] > limit and current['p95_ms'] - previous['p95_ms'] > min_delta_ms:
+                    regressions.append(f'[{scale}] {name}: p95 {previous["p95_ms"]}ms -> {current["p95_ms"]}ms')
+        return regressions
+
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    generate_image_variants.py
+# @Time:    2024/03/08
+"""
+为已有的菜品图片并行生成多尺寸版本
+
+用法：
+    python manage.py generate_image_variants              # 只处理还没有多尺寸版本的图片
+    python manage.py generate_image_variants --all --workers 8
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from restaurant_app.cache import bump_model_version
+from restaurant_app.images import render_variants, delete_stale_variants
+from restaurant_app.models import DishImage
+
+
+class Command(BaseCommand):
+    help = '为已有的菜品图片并行生成多尺寸版本'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='重新生成全部图片，包括已有多尺寸版本的图片')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='并行生成图片的线程数')
+
+    def handle(self, *args, **options):
+        images = DishImage.objects.order_by('id')
+        if not options['all']:
+            images = images.filter(variants={})
+        images = list(images.values_list('id', 'file', 'variants'))
+
+        updated, replaced, failed = [], [], 0
+        # 线程只负责读写图片文件，数据库在主线程中一次批量更新
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {executor.submit(render_variants, name): (image_id, name, variants)
+                       for image_id, name, variants in images}
+            for future in as_completed(futures):
+                image_id, name, variants = futures[future]
+                try:
+                    updated.append(DishImage(id=image_id, variants=future.result()))
+                    replaced.append(variants)
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'{name}: {exc}')
+
+        DishImage.objects.bulk_update(updated, ['variants'], batch_size=500)
+        # 删除重新生成后不再被引用的旧版本文件
+        delete_stale_variants(replaced)
+        if updated:
+            bump_model_version(DishImage)
+        self.stdout.write(self.style.SUCCESS(f'已生成{len(updated)}张图片的多尺寸版本，失败{failed}张。'))
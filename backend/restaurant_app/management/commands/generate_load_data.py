@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    generate_load_data.py
+# @Time:    2024/03/15
+"""
+批量生成压测用的模拟数据：桌位、菜品分类、单位、菜品、员工、订单和菜品详情
+
+与init_data.py不同，这里所有随机数都来自同一个可指定种子的随机数生成器，结果可复现；
+订单和菜品详情在内存中按天生成后用bulk_create分批写入，不触发逐行的信号，
+最后一次性重建菜品每日销量汇总表。订单的下单时间按午市、晚市的高峰分布，菜品销量按长尾分布，
+周末客流更多，用餐人数越多点的菜越多。
+
+用法：
+    python manage.py generate_load_data --tables 50 --days 365 --seed 42
+"""
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from restaurant_app.cache import bump_data_version, bump_model_version
+from restaurant_app.models import Table, DishCategory, DishUnit, DishImage, Dish, Order, DishDetail, Employee
+
+# 各小时的下单权重：午市11-13点、晚市17-20点是高峰
+HOUR_WEIGHTS = {10: 2, 11: 10, 12: 18, 13: 8, 14: 2, 15: 1, 16: 2, 17: 8, 18: 18, 19: 16, 20: 8, 21: 3}
+# 用餐人数1-10人的权重
+PARTY_SIZE_WEIGHTS = [8, 25, 18, 22, 10, 8, 4, 3, 1, 1]
+WEEKEND_FACTOR = 1.3
+UNITS = ['份', '盘', '碗', '例', '斤', '瓶']
+
+
+@contextmanager
+def disable_auto_now_add(*fields):
+    """
+    临时关闭auto_now_add，使bulk_create写入生成的历史时间，而不是当前时间。
+    """
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = '批量生成压测用的模拟数据'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='随机数种子，相同的种子和参数生成相同的数据')
+        parser.add_argument('--tables', type=int, default=50, help='桌位数量')
+        parser.add_argument('--days', type=int, default=365, help='生成最近多少天的订单')
+        parser.add_argument('--turns', type=float, default=3.0, help='每张桌子平均每天接待的订单数')
+        parser.add_argument('--categories', type=int, default=8, help='菜品分类数量')
+        parser.add_argument('--dishes', type=int, default=120, help='菜品数量')
+        parser.add_argument('--employees', type=int, default=100, help='员工数量')
+        parser.add_argument('--max-lines', type=int, default=30, help='每个订单最多的菜品详情数量')
+        parser.add_argument('--batch-size', type=int, default=5000, help='bulk_create每批写入的行数')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+
+        with transaction.atomic():
+            tables = self.create_tables(options['tables'])
+            dishes = self.create_dishes(options['categories'], options['dishes'])
+            self.create_employees(options['employees'])
+        self.stdout.write(f'基础数据：{len(tables)}张桌位，{len(dishes)}个菜品。')
+
+        order_count, line_count = self.create_orders(tables, dishes, options)
+        call_command('rebuild_daily_sales', stdout=self.stdout)
+        bump_data_version()
+        for model in (Table, DishCategory, DishUnit, DishImage, Dish):
+            bump_model_version(model)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'已生成{order_count}个订单，{line_count}条菜品详情，耗时{time.monotonic() - started:.1f}秒。'))
+
+    def create_tables(self, count):
+        existing = set(Table.objects.values_list('table_number', flat=True))
+        Table.objects.bulk_create([Table(table_number=number) for number in range(1, count + 1)
+                                   if number not in existing], batch_size=self.batch_size)
+        return list(Table.objects.filter(table_number__lte=count).values_list('id', flat=True))
+
+    def create_dishes(self, category_count, dish_count):
+        """
+        创建分类、单位和菜品，返回[(菜品id, 单价, 名称, 单位, 规格), ...]，按受欢迎程度从高到低排列。
+        """
+        categories = [DishCategory.objects.get_or_create(category=f'压测类别{i}')[0]
+                      for i in range(1, category_count + 1)]
+        units = [DishUnit.objects.get_or_create(unit=unit)[0] for unit in UNITS]
+
+        names = [f'压测菜品{i}' for i in range(1, dish_count + 1)]
+        existing = set(Dish.objects.filter(name__in=names).values_list('name', flat=True))
+        missing = [name for name in names if name not in existing]
+        images = DishImage.objects.bulk_create([DishImage(file=f'images/{name}.jpg', name=name) for name in missing],
+                                               batch_size=self.batch_size)
+        Dish.objects.bulk_create([
+            Dish(category=self.rng.choice(categories), specification=self.rng.choice(['精品', '小份', '大份']),
+                 file=image, name=name, unit=self.rng.choice(units),
+                 price=Decimal(self.rng.randint(8, 198)), is_on_sale=True)
+            for name, image in zip(missing, images)], batch_size=self.batch_size)
+
+        # 每个菜品为(id, 单价, 名称, 单位, 规格)，下单时复制到菜品详情上
+        dishes = dict((dish[2], dish) for dish in Dish.objects.filter(name__in=names).values_list(
+            'id', 'price', 'name', 'unit__unit', 'specification'))
+        ranked = [dishes[name] for name in names]
+        self.rng.shuffle(ranked)
+        return ranked
+
+    def create_employees(self, count):
+        numbers = [f'LT{i:06d}' for i in range(1, count + 1)]
+        existing = set(Employee.objects.filter(employee_number__in=numbers).values_list('employee_number', flat=True))
+        Employee.objects.bulk_create([
+            Employee(employee_number=number, name=f'压测员工{number[2:]}', gender=self.rng.choice(['男', '女']),
+                     position=self.rng.choice(['服务员', '服务员', '服务员', '厨师', '收银员', '经理']))
+            for number in numbers if number not in existing], batch_size=self.batch_size)
+
+    def create_orders(self, tables, dishes, options):
+        rng = self.rng
+        hours = list(HOUR_WEIGHTS)
+        hour_weights = list(accumulate(HOUR_WEIGHTS.values()))
+        party_sizes = list(range(1, len(PARTY_SIZE_WEIGHTS) + 1))
+        party_weights = list(accumulate(PARTY_SIZE_WEIGHTS))
+        # 菜品受欢迎程度服从齐夫分布
+        dish_weights = list(accumulate(1 / (rank ** 1.1) for rank in range(1, len(dishes) + 1)))
+
+        now = datetime.now()
+        today = date.today()
+        orders, lines = [], []
+        order_count = line_count = 0
+
+        with disable_auto_now_add(Order._meta.get_field('transaction_time'),
+                                  DishDetail._meta.get_field('order_time')):
+            for offset in range(options['days'] - 1, -1, -1):
+                day = today - timedelta(days=offset)
+                factor = WEEKEND_FACTOR if day.weekday() >= 5 else 1.0
+                day_orders = round(len(tables) * options['turns'] * factor * rng.uniform(0.8, 1.2))
+                times = sorted(datetime(day.year, day.month, day.day, hour, rng.randrange(60), rng.randrange(60),
+                                        rng.randrange(1000000))
+                               for hour in rng.choices(hours, cum_weights=hour_weights, k=day_orders))
+                for transaction_time in times:
+                    if transaction_time > now:
+                        break
+                    party_size = rng.choices(party_sizes, cum_weights=party_weights)[0]
+                    line_total = min(options['max_lines'], max(1, round(party_size * rng.uniform(0.8, 1.6))))
+                    order_lines = []
+                    chosen = rng.choices(dishes, cum_weights=dish_weights, k=line_total)
+                    for dish_id, price, name, unit, specification in chosen:
+                        quantity = 1 if rng.random() < 0.85 else 2
+                        order_time = min(transaction_time + timedelta(minutes=rng.randrange(30)), now)
+                        order_lines.append(DishDetail(order_time=order_time, dish_id=dish_id, quantity=quantity,
+                                                      total_price=price * quantity, name=name, unit=unit,
+                                                      specification=specification, unit_price=price))
+                    status = '未结账' if now - transaction_time < timedelta(hours=2) else '已结账'
+                    orders.append(Order(transaction_time=transaction_time, table_id=rng.choice(tables),
+                                        number_of_people=party_size, transaction_status=status,
+                                        total_amount=sum(line.total_price for line in order_lines)))
+                    lines.append(order_lines)
+
+                if len(orders) >= self.batch_size:
+                    line_count += self.flush(orders, lines)
+                    order_count += len(orders)
+                    orders, lines = [], []
+            if orders:
+                line_count += self.flush(orders, lines)
+                order_count += len(orders)
+        return order_count, line_count
+
+    def flush(self, orders, lines):
+        with transaction.atomic():
+            Order.objects.bulk_create(orders, batch_size=self.batch_size)
+            details = []
+            for order, order_lines in zip(orders, lines):
+                for line in order_lines:
+                    line.order_id = order.id
+                    details.append(line)
+            DishDetail.objects.bulk_create(details, batch_size=self.batch_size)
+        self.stdout.write(f'已写入截至{orders[-1].transaction_time:%Y-%m-%d}的订单。')
+        return len(details)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    load_test_analytics.py
+# @Time:    2024/03/25
+"""
+统计接口在WSGI和ASGI下的吞吐量对比
+
+在临时数据库中用generate_load_data生成数据，然后在进程内模拟两种部署方式，用--concurrency个客户端并发请求统计接口：
+- wsgi：同步的DRF接口，由--threads个工作线程处理请求，相当于一个gunicorn worker配置--threads；
+- asgi：异步接口，所有请求在一个事件循环中处理，相当于一个uvicorn worker。
+输出每种方式的每秒请求数和p50/p95延迟。默认关闭统计缓存，测量每次都执行查询时的情况。
+
+用法：
+    python manage.py load_test_analytics --concurrency 32 --requests 300 --days 90
+"""
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client, AsyncClient
+from django.test.utils import override_settings
+
+# (同步接口, 异步接口, 请求参数)
+ENDPOINTS = [
+    ('/api/dish/sales-rank/', '/api/async/dish/sales-rank/', {'period': 'month'}),
+    ('/api/dish-category/sales-rank/', '/api/async/dish-category/sales-rank/', {'period': 'month'}),
+    ('/api/order/total-amount-statistics/', '/api/async/order/total-amount-statistics/', {'period': 'month'}),
+]
+
+
+def summarize(timings, elapsed):
+    timings = sorted(timings)
+    return {
+        'requests_per_second': len(timings) / elapsed,
+        'p50_ms': statistics.median(timings),
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+    }
+
+
+class Command(BaseCommand):
+    help = '对比统计接口在WSGI（同步线程）和ASGI（事件循环）下的吞吐量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=32, help='并发的客户端数量')
+        parser.add_argument('--requests', type=int, default=300, help='每种方式发出的请求总数')
+        parser.add_argument('--threads', type=int, default=4, help='WSGI方式的工作线程数')
+        parser.add_argument('--days', type=int, default=90, help='生成最近多少天的订单')
+        parser.add_argument('--tables', type=int, default=30, help='桌位数量')
+        parser.add_argument('--cached', action='store_true', help='启用统计缓存，默认每次请求都执行查询')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            # 并发的查询在各自的线程和连接中执行，需要使用文件数据库
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.gettempdir(), 'load_test.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write('生成数据...')
+            call_command('generate_load_data', f'--days={options["days"]}', f'--tables={options["tables"]}',
+                         '--employees=0', stdout=StringIO())
+            connections.close_all()
+
+            # ANALYTICS_CACHE_TIMEOUT为0时缓存立即过期
+            cache_settings = {} if options['cached'] else {'ANALYTICS_CACHE_TIMEOUT': 0}
+            with override_settings(REPLICA_DATABASE=None, ANALYTICS_PARALLEL_QUERIES=True, **cache_settings):
+                results = {
+                    'wsgi': self.run_wsgi(options),
+                    'asgi': asyncio.run(self.run_asgi(options)),
+                }
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for mode, result in results.items():
+            self.stdout.write(f'{mode}: {result["requests_per_second"]:8.1f} 请求/秒 '
+                              f'p50={result["p50_ms"]:.1f}ms p95={result["p95_ms"]:.1f}ms')
+        self.stdout.write(self.style.SUCCESS(
+            f'asgi的吞吐量是wsgi的{results["asgi"]["requests_per_second"] / results["wsgi"]["requests_per_second"]:.2f}倍。'))
+
+    def run_wsgi(self, options):
+        local = threading.local()
+        workers = threading.Semaphore(options['threads'])
+
+        def request(index):
+            sync_url, _, params = ENDPOINTS[index % len(ENDPOINTS)]
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            started = time.perf_counter()
+            # 同时只有--threads个请求在处理，其余客户端的请求排队等待空闲的工作线程
+            with workers:
+                try:
+                    response = local.client.get(sync_url, params)
+                    assert response.status_code == 200, response.status_code
+                finally:
+                    connections.close_all()  # 与CONN_MAX_AGE=0时一样，每个请求结束后关闭连接
+            return (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            timings = list(executor.map(request, range(options['requests'])))
+        return summarize(timings, time.perf_counter() - started)
+
+    async def run_asgi(self, options):
+        client = AsyncClient()
+        # 与wsgi方式一样，同时最多有--concurrency个客户端在等待响应，延迟从客户端发出请求开始计算
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def request(index):
+            _, async_url, params = ENDPOINTS[index % len(ENDPOINTS)]
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(async_url, params)
+                assert response.status_code == 200, response.status_code
+                return (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        timings = await asyncio.gather(*(request(index) for index in range(options['requests'])))
+        return summarize(timings, time.perf_counter() - started)
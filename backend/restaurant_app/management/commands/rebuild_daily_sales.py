@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    rebuild_daily_sales.py
+# @Time:    2024/02/22
+"""
+根据DishDetail原始数据重建菜品每日销量汇总表，用于历史数据回填或修复汇总数据
+
+用法：
+    python manage.py rebuild_daily_sales                                    # 重建全部日期
+    python manage.py rebuild_daily_sales --start 2024-01-01 --end 2024-01-31  # 只重建指定日期范围（包含首尾）
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+from restaurant_app.cache import bump_data_version
+from restaurant_app.models import DishDetail, DailyDishSales
+
+
+class Command(BaseCommand):
+    help = '根据菜品详情重建菜品每日销量汇总表'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='开始日期，格式为YYYY-MM-DD')
+        parser.add_argument('--end', help='结束日期，格式为YYYY-MM-DD')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的汇总行数量')
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as exc:
+            raise CommandError(f'无效的日期：{exc}')
+
+        # 菜品已被删除的菜品详情没有对应的汇总行
+        details = DishDetail.objects.filter(dish__isnull=False).annotate(date=TruncDate('order_time'))
+        rollups = DailyDishSales.objects.all()
+        if start is not None:
+            details = details.filter(date__gte=start)
+            rollups = rollups.filter(date__gte=start)
+        if end is not None:
+            details = details.filter(date__lte=end)
+            rollups = rollups.filter(date__lte=end)
+
+        rows = details.values('date', 'dish_id', 'dish__category_id') \
+            .annotate(quantity=Sum('quantity'), revenue=Sum('total_price')) \
+            .order_by('date', 'dish_id')
+
+        with transaction.atomic():
+            rollups.delete()
+            created = DailyDishSales.objects.bulk_create(
+                (DailyDishSales(date=row['date'], dish_id=row['dish_id'], category_id=row['dish__category_id'],
+                                quantity=row['quantity'], revenue=row['revenue'] or 0) for row in rows.iterator()),
+                batch_size=options['batch_size'])
+            # delete和bulk_create不会触发信号，需要自己使统计接口的缓存失效
+            bump_data_version()
+
+        self.stdout.write(self.style.SUCCESS(f'已重建{len(created)}条菜品每日销量汇总数据。'))
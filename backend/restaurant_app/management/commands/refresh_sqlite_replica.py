@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    refresh_sqlite_replica.py
+# @Time:    2024/03/22
+"""
+用SQLite的在线备份接口把主库复制为只读副本
+
+先备份到临时文件，完成后再原子地替换副本文件，正在读取副本的连接不会读到写了一半的文件。
+备份不会长时间阻塞主库的写入：备份过程中主库被修改时SQLite会自动重新开始，
+因此间隔不宜过短，一般几十秒到几分钟刷新一次即可。
+
+用法：
+    python manage.py refresh_sqlite_replica                 # 刷新一次，路径默认取环境变量DJANGO_DB_REPLICA
+    python manage.py refresh_sqlite_replica --interval 60   # 每60秒刷新一次，直到进程退出
+"""
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def backup_database(connection, path):
+    """
+    把connection对应的SQLite数据库备份到path，返回耗时（秒）。
+    """
+    started = time.monotonic()
+    temp_path = f'{path}.tmp'
+    connection.ensure_connection()
+    target = sqlite3.connect(temp_path)
+    try:
+        connection.connection.backup(target)
+        # 副本以只读方式打开，不能使用需要写-shm文件的WAL模式
+        target.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        target.close()
+    os.replace(temp_path, path)
+    return time.monotonic() - started
+
+
+class Command(BaseCommand):
+    help = '把主库备份为只读副本，可以定期刷新'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=getattr(settings, 'SQLITE_REPLICA_PATH', None),
+                            help='副本文件路径，默认为环境变量DJANGO_DB_REPLICA')
+        parser.add_argument('--interval', type=float, default=0, help='刷新间隔（秒），0表示只刷新一次')
+
+    def handle(self, *args, **options):
+        connection = connections[DEFAULT_DB_ALIAS]
+        if connection.vendor != 'sqlite':
+            raise CommandError('只支持SQLite数据库，其他数据库请使用数据库自带的主从复制。')
+        if not options['path']:
+            raise CommandError('请通过--path或环境变量DJANGO_DB_REPLICA指定副本文件路径。')
+
+        while True:
+            elapsed = backup_database(connection, options['path'])
+            self.stdout.write(f'已刷新副本{options["path"]}，耗时{elapsed:.2f}秒。')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
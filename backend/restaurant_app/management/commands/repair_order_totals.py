@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    repair_order_totals.py
+# @Time:    2024/02/20
+"""
+检查并修复订单total_amount与其菜品详情总价之和不一致的数据
+
+用法：
+    python manage.py repair_order_totals            # 检查并修复
+    python manage.py repair_order_totals --dry-run  # 只检查，不修复
+"""
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum, Value, Q, F, DecimalField
+from django.db.models.functions import Coalesce
+
+from restaurant_app.cache import bump_data_version
+from restaurant_app.models import Order
+
+
+class Command(BaseCommand):
+    help = '检查并修复订单总价(total_amount)与菜品详情总价之和不一致的订单'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='只输出不一致的订单，不写入数据库')
+        parser.add_argument('--batch-size', type=int, default=500, help='每批更新的订单数量')
+
+    def handle(self, *args, **options):
+        zero = Value(Decimal('0.00'), output_field=DecimalField(max_digits=7, decimal_places=2))
+        # 一条聚合查询找出所有不一致的订单
+        drifted = Order.objects \
+            .annotate(line_total=Coalesce(Sum('dishdetail__total_price'), zero),
+                      current_total=Coalesce('total_amount', zero)) \
+            .filter(~Q(current_total=F('line_total'))) \
+            .values_list('id', 'total_amount', 'line_total') \
+            .order_by('id')
+
+        orders = []
+        for order_id, total_amount, line_total in drifted:
+            if options['verbosity'] > 1:
+                self.stdout.write(f'订单{order_id}: {total_amount} -> {line_total}')
+            orders.append(Order(id=order_id, total_amount=line_total))
+
+        if not orders:
+            self.stdout.write(self.style.SUCCESS('所有订单总价均一致。'))
+            return
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'共{len(orders)}个订单总价不一致（未修复）。'))
+            return
+
+        with transaction.atomic():
+            Order.objects.bulk_update(orders, ['total_amount'], batch_size=options['batch_size'])
+            # bulk_update不会触发信号，需要自己使统计接口的缓存失效
+            bump_data_version()
+        self.stdout.write(self.style.SUCCESS(f'已修复{len(orders)}个订单的总价。'))
+
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    sqlite_stress.py
+# @Time:    2024/03/20
+"""
+SQLite并发写入压力测试
+
+模拟晚市高峰：多个线程同时下单，每个订单在一个事务中创建Order和若干DishDetail（会触发订单总价和每日销量汇总的更新）。
+分别使用Django默认的SQLite配置（stock）和settings.SQLITE_PRODUCTION（production）在临时数据库文件上运行，
+输出每秒完成的订单数、菜品详情数，以及database is locked等错误的次数，用于对比两种配置的吞吐量。
+
+用法：
+    python manage.py sqlite_stress --threads 8 --duration 10
+"""
+import os
+import random
+import tempfile
+import threading
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction, OperationalError
+
+from restaurant_app.models import Table, Dish, Order, DishDetail
+
+PROFILES = {
+    'stock': {'ENGINE': 'django.db.backends.sqlite3', 'CONN_MAX_AGE': 0, 'OPTIONS': {}},
+    'production': settings.SQLITE_PRODUCTION,
+}
+
+
+class Command(BaseCommand):
+    help = '对比默认SQLite配置和生产配置在并发写入下的吞吐量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default='stock,production', help=f'要测试的配置，可选{list(PROFILES)}')
+        parser.add_argument('--threads', type=int, default=8, help='并发写入的线程数')
+        parser.add_argument('--duration', type=float, default=10, help='每种配置的测试时长（秒）')
+        parser.add_argument('--lines', type=int, default=5, help='每个订单的菜品详情数量')
+
+    def handle(self, *args, **options):
+        profiles = [profile.strip() for profile in options['profiles'].split(',') if profile.strip()]
+        unknown = [profile for profile in profiles if profile not in PROFILES]
+        if unknown:
+            raise CommandError(f'未知的配置：{unknown}')
+
+        original = connections.settings['default']
+        try:
+            results = {profile: self.run_profile(profile, original, options) for profile in profiles}
+        finally:
+            self.use_database(original)
+
+        for profile, result in results.items():
+            self.stdout.write(f'{profile:>10}: {result["orders"] / options["duration"]:8.1f} 订单/秒 '
+                              f'{result["lines"] / options["duration"]:8.1f} 菜品详情/秒 '
+                              f'{result["errors"]} 次错误')
+        if 'stock' in results and 'production' in results and results['stock']['orders']:
+            self.stdout.write(self.style.SUCCESS(
+                f'production的吞吐量是stock的{results["production"]["orders"] / results["stock"]["orders"]:.2f}倍。'))
+
+    def use_database(self, settings_dict):
+        connections['default'].close()
+        connections.settings['default'] = settings_dict
+        del connections['default']
+
+    def run_profile(self, profile, original, options):
+        path = os.path.join(tempfile.gettempdir(), f'sqlite_stress_{profile}.sqlite3')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        settings_dict = {**original, **PROFILES[profile], 'NAME': path}
+        self.use_database(settings_dict)
+
+        call_command('migrate', run_syncdb=True, verbosity=0)
+        call_command('generate_load_data', '--days=0', '--tables=50', '--dishes=100', '--employees=0',
+                     stdout=StringIO())
+        tables = list(Table.objects.values_list('id', flat=True))
+        dishes = list(Dish.objects.all())
+        connections['default'].close()
+
+        result = {'orders': 0, 'lines': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['duration']
+
+        def worker(seed):
+            rng = random.Random(seed)
+            orders = lines = errors = 0
+            try:
+                while time.monotonic() < deadline:
+                    try:
+                        with transaction.atomic():
+                            order = Order.objects.create(table_id=rng.choice(tables),
+                                                         number_of_people=rng.randint(1, 8))
+                            for dish in rng.sample(dishes, options['lines']):
+                                DishDetail.objects.create(dish=dish, order=order, quantity=rng.randint(1, 2))
+                        orders += 1
+                        lines += options['lines']
+                    except OperationalError:
+                        errors += 1
+            finally:
+                connections['default'].close()
+                with lock:
+                    result['orders'] += orders
+                    result['lines'] += lines
+                    result['errors'] += errors
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return result
@@ -1,8 +1,15 @@
-from django.db import models
-from django.db.models.signals import pre_save, post_save
+from decimal import Decimal
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_save, post_init, post_save, post_delete
 from django.dispatch import receiver
 from os.path import splitext
 
+from .cache import bump_data_version, bump_model_version
+from .kitchen import schedule_kitchen_wakeup
+from .table_status import schedule_table_status
+
 
 # 桌位表
 class Table(models.Model):
@@ -30,8 +37,11 @@ class DishUnit(models.Model):
 
 # 菜品图片表
 class DishImage(models.Model):
-    file = models.ImageField(upload_to='images/', verbose_name='菜品图片', unique=True)
+    # 文件名带内容哈希（见storage.py），同一张图片重复上传时多条记录共用同一个文件
+    file = models.ImageField(upload_to='images/', verbose_name='菜品图片')
     name = models.CharField(max_length=200, verbose_name='菜品图片名称', blank=True)
+    # 多尺寸版本的文件路径，由images.py在上传后生成，格式为{尺寸: {格式: 路径}}
+    variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name='菜品图片多尺寸版本')
 
     def __str__(self):
         return self.name
@@ -59,12 +69,15 @@ class Order(models.Model):
     total_amount = models.DecimalField(max_digits=7, decimal_places=2, verbose_name='交易金额', blank=True, null=True)
     transaction_status = models.CharField(max_length=200, verbose_name='交易状态', default='未结账')
 
-    # 添加一个条件来检查total_amount是否已经改变，如果没有改变，就不需要再次保存
-    def save(self, *args, **kwargs):
-        old_total_amount = self.total_amount
-        super().save(*args, **kwargs)
-        if old_total_amount != self.total_amount:
-            super().save(*args, **kwargs)
+    class Meta:
+        indexes = [
+            # 按时间段过滤订单（订单列表、总价区间统计）
+            models.Index(fields=['transaction_time'], name='order_time_idx'),
+            # 按桌号和时间段过滤订单（订单列表）
+            models.Index(fields=['table', 'transaction_time'], name='order_table_time_idx'),
+            # 查询各桌位未结账的订单（桌位状态）
+            models.Index(fields=['transaction_status', 'table'], name='order_status_table_idx'),
+        ]
 
     def __str__(self):
         return str(self.id)
@@ -73,14 +86,41 @@ class Order(models.Model):
 # 菜品详情表
 class DishDetail(models.Model):
     order_time = models.DateTimeField(auto_now_add=True, verbose_name='下单时间')
-    dish = models.ForeignKey(Dish, on_delete=models.CASCADE, verbose_name='菜品id',
+    # 菜品被删除后保留菜品详情，名称、单位、规格和单价使用下单时的快照
+    dish = models.ForeignKey(Dish, on_delete=models.SET_NULL, verbose_name='菜品id', null=True,
                              limit_choices_to={'is_on_sale': True})
     order = models.ForeignKey(Order, on_delete=models.CASCADE, verbose_name='订单id')
     quantity = models.PositiveIntegerField(verbose_name='菜品下单数量')
     total_price = models.DecimalField(max_digits=6, decimal_places=2, verbose_name='总价', blank=True, null=True)
+    # 下单时菜品的快照，由pre_save信号从菜品复制，之后修改菜单不影响已下单的菜品详情
+    name = models.CharField(max_length=200, verbose_name='菜品名称', blank=True, default='')
+    unit = models.CharField(max_length=200, verbose_name='菜品单位', blank=True, default='')
+    specification = models.CharField(max_length=200, verbose_name='菜品规格', blank=True, default='')
+    unit_price = models.DecimalField(max_digits=6, decimal_places=2, verbose_name='菜品单价', blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # 按下单时间段过滤并按菜品分组（销量排行榜）
+            models.Index(fields=['order_time', 'dish'], name='dishdetail_time_dish_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} - {self.order_id}'
+
+
+# 菜品每日销量汇总表，由DishDetail的信号增量维护，供销量排行榜使用
+class DailyDishSales(models.Model):
+    date = models.DateField(verbose_name='日期')
+    dish = models.ForeignKey(Dish, on_delete=models.CASCADE, verbose_name='菜品id')
+    category = models.ForeignKey(DishCategory, on_delete=models.CASCADE, verbose_name='菜品所属分类')
+    quantity = models.IntegerField(default=0, verbose_name='销量')
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='销售额')
+
+    class Meta:
+        unique_together = ('date', 'dish')
 
     def __str__(self):
-        return f'{self.dish.name} - {self.order.id}'
+        return f'{self.date} - {self.dish_id}'
 
 
 # 员工表
@@ -109,15 +149,193 @@ def save_image_name(sender, instance, **kwargs):
         instance.name = splitext(instance.file.name)[0]
 
 
-# 在保存DishDetail之前，计算total_price
+def apply_order_total_delta(order_id, delta):
+    """
+    在数据库中以原子方式将delta累加到订单的total_amount上，只产生一条UPDATE语句。
+    total_amount为空时按0处理。
+    """
+    if not delta:
+        return
+    Order.objects.filter(pk=order_id).update(
+        total_amount=Coalesce(F('total_amount'), Value(Decimal('0.00'))) + Value(delta))
+
+
+def snapshot_dish(line, dish):
+    """
+    把菜品当前的名称、单位、规格和单价复制到菜品详情上。
+    """
+    line.name = dish.name
+    line.unit = dish.unit.unit
+    line.specification = dish.specification
+    line.unit_price = dish.price
+
+
+# 在保存DishDetail之前，记录修改前的订单和总价，用于计算增量；
+# 新下单或更换了菜品时复制菜品快照，total_price按快照的单价计算，之后修改菜品价格不影响已下单的菜品
 @receiver(pre_save, sender=DishDetail)
 def calculate_total_price(sender, instance, **kwargs):
-    instance.total_price = instance.dish.price * instance.quantity
+    instance._previous_line = None
+    if not instance._state.adding and instance.pk is not None:
+        instance._previous_line = DishDetail.objects.filter(pk=instance.pk) \
+            .values('order_id', 'total_price', 'dish_id', 'quantity').first()
+    previous = instance._previous_line
+    if instance.dish_id is not None and (instance.unit_price is None or
+                                         previous is not None and previous['dish_id'] != instance.dish_id):
+        snapshot_dish(instance, instance.dish)
+    if instance.unit_price is not None:
+        instance.total_price = instance.unit_price * instance.quantity
+
+
+# 在保存DishDetail之后，按增量更新相关Order的total_amount，不再重新汇总订单的全部菜品
+@receiver(post_save, sender=DishDetail)
+def update_order_total_amount(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_line', None)
+    total_price = instance.total_price or Decimal('0.00')
+    if created or previous is None:
+        apply_order_total_delta(instance.order_id, total_price)
+        return
+
+    old_order_id = previous['order_id']
+    old_total_price = previous['total_price'] or Decimal('0.00')
+    if old_order_id == instance.order_id:
+        apply_order_total_delta(instance.order_id, total_price - old_total_price)
+    else:
+        # 菜品被移到了另一个订单
+        apply_order_total_delta(old_order_id, -old_total_price)
+        apply_order_total_delta(instance.order_id, total_price)
+
+
+# 在删除DishDetail之后，从相关Order的total_amount中减去该菜品的总价
+@receiver(post_delete, sender=DishDetail)
+def subtract_order_total_amount(sender, instance, origin=None, **kwargs):
+    # 订单本身被删除时级联删除的菜品无需再更新订单
+    if isinstance(origin, Order) or (isinstance(origin, models.QuerySet) and origin.model is Order):
+        return
+    if not instance.total_price:
+        return
+    apply_order_total_delta(instance.order_id, -instance.total_price)
+
+
+def apply_daily_dish_sales_delta(date, dish_id, quantity, revenue, category_id=None):
+    """
+    将销量和销售额的增量累加到菜品每日销量汇总表上。
+    汇总行不存在且销量增量为正时创建该行（减少销量时不创建负数的汇总行），此时需要提供category_id。
+    """
+    if not quantity and not revenue:
+        return
+    rows = DailyDishSales.objects.filter(date=date, dish_id=dish_id)
+    changes = {'quantity': F('quantity') + quantity, 'revenue': F('revenue') + Value(revenue)}
+    if rows.update(**changes) or category_id is None or quantity <= 0:
+        # 减少销量时汇总行不存在（例如该日期还没有重建汇总数据），不创建负数的汇总行
+        return
+    try:
+        with transaction.atomic():
+            DailyDishSales.objects.create(date=date, dish_id=dish_id, category_id=category_id,
+                                          quantity=quantity, revenue=revenue)
+    except IntegrityError:
+        # 并发写入时汇总行已被其他请求创建
+        rows.update(**changes)
+
+
+# 在保存DishDetail之后，按增量更新菜品每日销量汇总表
+@receiver(post_save, sender=DishDetail)
+def update_daily_dish_sales(sender, instance, created, **kwargs):
+    date = instance.order_time.date()
+    revenue = instance.total_price or Decimal('0.00')
+    previous = getattr(instance, '_previous_line', None)
+    category_id = instance.dish.category_id if instance.dish_id is not None else None  # 菜品已被删除时没有汇总行
+    if created or previous is None:
+        apply_daily_dish_sales_delta(date, instance.dish_id, instance.quantity, revenue, category_id)
+        return
+
+    old_revenue = previous['total_price'] or Decimal('0.00')
+    if previous['dish_id'] == instance.dish_id:
+        apply_daily_dish_sales_delta(date, instance.dish_id, instance.quantity - previous['quantity'],
+                                     revenue - old_revenue, category_id)
+    else:
+        apply_daily_dish_sales_delta(date, previous['dish_id'], -previous['quantity'], -old_revenue)
+        apply_daily_dish_sales_delta(date, instance.dish_id, instance.quantity, revenue, category_id)
+
+
+# 在删除DishDetail之后，从菜品每日销量汇总表中减去该菜品的销量（包括订单被删除时级联删除的菜品）
+@receiver(post_delete, sender=DishDetail)
+def subtract_daily_dish_sales(sender, instance, **kwargs):
+    apply_daily_dish_sales_delta(instance.order_time.date(), instance.dish_id, -instance.quantity,
+                                 -(instance.total_price or Decimal('0.00')))
+
+
+# 菜品更换分类时同步更新该菜品已有的每日销量汇总行，汇总表和原始菜品详情统计出的分类保持一致
+@receiver(pre_save, sender=Dish)
+def remember_dish_category(sender, instance, **kwargs):
+    instance._previous_category_id = None
+    if not instance._state.adding and instance.pk is not None:
+        instance._previous_category_id = Dish.objects.filter(pk=instance.pk) \
+            .values_list('category_id', flat=True).first()
+
+
+@receiver(post_save, sender=Dish)
+def update_daily_dish_sales_category(sender, instance, created, **kwargs):
+    previous_category_id = getattr(instance, '_previous_category_id', None)
+    if not created and previous_category_id is not None and previous_category_id != instance.category_id:
+        DailyDishSales.objects.filter(dish_id=instance.pk).update(category_id=instance.category_id)
+
+
+# 订单、菜品详情、菜品或菜品分类变化后，递增统计数据版本号，使统计接口的缓存失效
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=DishDetail)
+@receiver(post_delete, sender=DishDetail)
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+@receiver(post_save, sender=DishCategory)
+@receiver(post_delete, sender=DishCategory)
+def invalidate_analytics_cache(sender, **kwargs):
+    bump_data_version()
+
+
+# 基础数据和菜品变化后，递增对应模型的版本号，使列表接口的ETag失效
+@receiver(post_save, sender=Table)
+@receiver(post_delete, sender=Table)
+@receiver(post_save, sender=DishCategory)
+@receiver(post_delete, sender=DishCategory)
+@receiver(post_save, sender=DishUnit)
+@receiver(post_delete, sender=DishUnit)
+@receiver(post_save, sender=DishImage)
+@receiver(post_delete, sender=DishImage)
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+def invalidate_model_etag(sender, **kwargs):
+    bump_model_version(sender)
+
+
+# 订单变化时发布桌位状态；订单换桌时原来的桌位也要更新。
+# 加载订单时记下桌位，保存时不用再查询数据库；延迟加载的table_id不读取，避免额外的查询
+@receiver(post_init, sender=Order)
+def remember_order_table(sender, instance, **kwargs):
+    instance._previous_table_id = instance.__dict__.get('table_id')
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def publish_order_table_status(sender, instance, **kwargs):
+    schedule_table_status(table_id=instance.table_id)
+    previous_table_id = getattr(instance, '_previous_table_id', None)
+    if previous_table_id is not None and previous_table_id != instance.table_id:
+        schedule_table_status(table_id=previous_table_id)
+    instance._previous_table_id = instance.table_id
+
+
+# 菜品详情变化会改变订单的未结账金额；删除订单时级联删除的菜品详情由订单的信号处理
+@receiver(post_save, sender=DishDetail)
+@receiver(post_delete, sender=DishDetail)
+def publish_dish_detail_table_status(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Order) or (isinstance(origin, models.QuerySet) and origin.model is Order):
+        return
+    schedule_table_status(order_id=instance.order_id)
 
 
-# 在保存DishDetail之后，更新相关的Order的total_amount
+# 新的菜品详情提交后唤醒等待后厨单的客户端
 @receiver(post_save, sender=DishDetail)
-def update_order_total_amount(sender, instance, **kwargs):
-    order = instance.order
-    order.total_amount = sum(detail.total_price for detail in order.dishdetail_set.all())
-    order.save()
+def publish_kitchen_ticket(sender, instance, created, **kwargs):
+    if created:
+        schedule_kitchen_wakeup()
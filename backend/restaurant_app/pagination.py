@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    pagination.py
+# @Time:    2024/03/01
+"""
+游标分页（keyset分页）
+
+全局的PageNumberPagination每次都要执行COUNT(*)，并且页码越大OFFSET越大，翻到历史数据的深页时会越来越慢。
+游标分页按排序字段定位下一页，不需要COUNT和大OFFSET，翻页期间插入新数据也不会造成重复或遗漏。
+游标分页是可选的：请求参数中带有cursor，或者pagination=cursor时使用游标分页，否则仍使用全局的页码分页。
+"""
+from rest_framework.pagination import CursorPagination
+
+
+# 订单游标分页，按交易时间倒序，交易时间相同时按id倒序
+class OrderCursorPagination(CursorPagination):
+    ordering = ('-transaction_time', '-id')
+
+
+# 菜品详情游标分页，按id正序
+class DishDetailCursorPagination(CursorPagination):
+    ordering = ('id',)
+
+
+class OptionalCursorPaginationMixin:
+    """
+    为ViewSet提供可选的游标分页，cursor_pagination_class为使用的游标分页类。
+    """
+    cursor_pagination_class = None
+
+    def use_cursor_pagination(self):
+        params = self.request.query_params
+        return self.cursor_pagination_class is not None and \
+            ('cursor' in params or params.get('pagination') == 'cursor')
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.use_cursor_pagination():
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
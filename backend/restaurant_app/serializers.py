@@ -1,6 +1,15 @@
 # serializers.py
+from collections import defaultdict, Counter
+from decimal import Decimal
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils.functional import cached_property
 from rest_framework import serializers
-from .models import Table, DishCategory, DishUnit, DishImage, Dish, Order, DishDetail, Employee
+from .models import Table, DishCategory, DishUnit, DishImage, Dish, Order, DishDetail, Employee, \
+    apply_daily_dish_sales_delta
+from .kitchen import schedule_kitchen_wakeup
 
 
 # 桌位表序列化
@@ -36,24 +45,41 @@ class DishSerializer(serializers.ModelSerializer):
     dish_unit = serializers.SerializerMethodField()  # 菜品单位
     dish_category = serializers.SerializerMethodField()  # 菜品规格
     dish_url = serializers.SerializerMethodField()  # 菜品图片url
+    dish_variants = serializers.SerializerMethodField()  # 菜品图片多尺寸版本url
 
     class Meta:
         model = Dish
         fields = '__all__'
 
+    # 分类、单位和图片由视图通过select_related一次JOIN取出
     def get_dish_unit(self, obj):
         return obj.unit.unit
 
     def get_dish_category(self, obj):
         return obj.category.category
 
-    # obj.file.file.url只会返回相对URL。为了获取完整的URL，需要使用request.build_absolute_uri()方法
-    def get_dish_url(self, obj):
+    # obj.file.file.url只会返回相对URL。完整URL的协议和域名部分每个请求只计算一次，而不是每行调用build_absolute_uri
+    @cached_property
+    def base_url(self):
         request = self.context.get('request')
-        if obj.file and hasattr(obj.file.file, 'url'):
-            return request.build_absolute_uri(obj.file.file.url)
+        return request.build_absolute_uri('/').rstrip('/') if request is not None else ''
+
+    def get_absolute_url(self, url):
+        return self.base_url + url if url.startswith('/') else url
+
+    def get_dish_url(self, obj):
+        if obj.file and obj.file.file:
+            return self.get_absolute_url(obj.file.file.url)
         return None
 
+    # 图片多尺寸版本的完整URL，格式为{尺寸: {格式: url}}，尚未生成时为空字典
+    def get_dish_variants(self, obj):
+        if not obj.file:
+            return {}
+        return {variant: {format_name: self.get_absolute_url(default_storage.url(path))
+                          for format_name, path in paths.items()}
+                for variant, paths in obj.file.variants.items()}
+
 
 # 订单表序列化
 class OrderSerializer(serializers.ModelSerializer):
@@ -63,33 +89,83 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = '__all__'
+        read_only_fields = ('total_amount',)  # 由菜品详情的信号增量维护
 
     def get_transaction_time(self, obj):
         return obj.transaction_time.strftime("%Y-%m-%d %H:%M:%S")
 
+    # 只保存请求中修改的字段，不写回请求开始时读取的total_amount，避免覆盖期间并发写入的菜品总价
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        if validated_data:
+            instance.save(update_fields=list(validated_data))
+            instance.refresh_from_db(fields=['total_amount'])
+        return instance
+
+    # 菜品详情由视图通过prefetch_related一次性取出（连同菜品和单位），这里不再逐个订单查询
     def get_dish_details(self, obj):
-        dish_details = DishDetail.objects.filter(order=obj)
-        return DishDetailSerializer(dish_details, many=True).data
+        return DishDetailSerializer(obj.dishdetail_set.all(), many=True).data
 
 
 # 菜品详情表序列化
+# 菜品名称、单位、规格和单价是下单时的快照，直接从菜品详情表读取，不需要关联菜品表
 class DishDetailSerializer(serializers.ModelSerializer):
-    name = serializers.SerializerMethodField()  # 菜品名称
-    unit = serializers.SerializerMethodField()  # 菜品单位
-    specification = serializers.SerializerMethodField()  # 菜品规格
-
     class Meta:
         model = DishDetail
         fields = '__all__'
-
-    def get_name(self, obj):
-        return obj.dish.name
-
-    def get_unit(self, obj):
-        return obj.dish.unit.unit
-
-    def get_specification(self, obj):
-        return obj.dish.specification
+        read_only_fields = ('name', 'unit', 'specification', 'unit_price')
+        # 菜品删除后数据库中的dish为空，但新建或修改菜品详情时必须指定菜品
+        extra_kwargs = {'dish': {'required': True, 'allow_null': False}}
+
+
+# 一次性提交订单中的单个菜品
+class OrderSubmitItemSerializer(serializers.Serializer):
+    dish = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+# 一次性提交订单：在一个事务中创建订单和全部菜品详情
+class OrderSubmitSerializer(serializers.Serializer):
+    table = serializers.PrimaryKeyRelatedField(queryset=Table.objects.all())
+    number_of_people = serializers.IntegerField(min_value=1)
+    dishes = OrderSubmitItemSerializer(many=True, allow_empty=False)
+
+    def validate_dishes(self, value):
+        # 一条查询取出所有菜品的单价
+        dish_ids = {item['dish'] for item in value}
+        dishes = {dish['id']: dish for dish in Dish.objects.filter(id__in=dish_ids, is_on_sale=True).values(
+            'id', 'name', 'specification', 'price', 'category_id', unit_name=F('unit__unit'))}
+        missing = sorted(dish_ids - dishes.keys())
+        if missing:
+            raise serializers.ValidationError(f'菜品不存在或已下架：{missing}')
+        for item in value:
+            item['snapshot'] = dishes[item['dish']]
+            item['price'], item['category'] = item['snapshot']['price'], item['snapshot']['category_id']
+        return value
+
+    def create(self, validated_data):
+        dishes = validated_data.pop('dishes')
+        lines = [DishDetail(dish_id=item['dish'], quantity=item['quantity'], total_price=item['price'] * item['quantity'],
+                            name=item['snapshot']['name'], unit=item['snapshot']['unit_name'],
+                            specification=item['snapshot']['specification'], unit_price=item['price'])
+                 for item in dishes]
+        # bulk_create不会触发DishDetail的信号，订单总价和每日销量汇总在这里一次算好
+        with transaction.atomic():
+            order = Order.objects.create(total_amount=sum(line.total_price for line in lines), **validated_data)
+            for line in lines:
+                line.order = order
+            DishDetail.objects.bulk_create(lines)
+            schedule_kitchen_wakeup()
+
+            sales = defaultdict(lambda: [0, Decimal('0.00')])
+            for item, line in zip(dishes, lines):
+                sales[item['dish'], item['category']][0] += line.quantity
+                sales[item['dish'], item['category']][1] += line.total_price
+            date = lines[0].order_time.date()
+            for (dish_id, category_id), (quantity, revenue) in sales.items():
+                apply_daily_dish_sales_delta(date, dish_id, quantity, revenue, category_id)
+        return order
 
 
 # 员工表序列化
@@ -102,3 +178,78 @@ class EmployeeSerializer(serializers.ModelSerializer):
 
     def get_created_at(self, obj):
         return obj.created_at.strftime("%Y-%m-%d %H:%M:%S")
+
+
+# 批量写入员工的列表序列化：工号的唯一性对整批数据一次性检查，写入使用bulk_create/bulk_update
+class EmployeeBulkListSerializer(serializers.ListSerializer):
+
+    def to_internal_value(self, data):
+        try:
+            validated_data, errors = super().to_internal_value(data), [{} for _ in data]
+        except serializers.ValidationError as exc:
+            if not isinstance(exc.detail, list):
+                raise
+            validated_data, errors = None, exc.detail
+
+        # 逐行校验有错误时同样检查工号，一次返回整批数据的全部错误
+        upsert = self.context.get('upsert', False)
+        numbers = [str(item['employee_number']).strip()
+                   if isinstance(item, dict) and item.get('employee_number') is not None else None for item in data]
+        counts = Counter(number for number in numbers if number)
+        existing = dict(Employee.objects.filter(employee_number__in=list(counts))
+                        .values_list('employee_number', 'id'))
+        for item, number, error in zip(data, numbers, errors):
+            if not number or 'employee_number' in error:
+                continue
+            if counts[number] > 1:
+                error['employee_number'] = ['工号重复。']
+            elif number in existing and not upsert and existing[number] != item.get('id'):
+                error['employee_number'] = ['工号已存在。']
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return validated_data
+
+    def create(self, validated_data):
+        """
+        批量创建员工；context中upsert为True时，工号已存在的员工改为更新。
+        """
+        validated_data = [{key: value for key, value in item.items() if key != 'id'} for item in validated_data]
+        existing = {}
+        if self.context.get('upsert', False):
+            existing = Employee.objects.in_bulk([item['employee_number'] for item in validated_data],
+                                                field_name='employee_number')
+        with transaction.atomic():
+            created = Employee.objects.bulk_create(
+                [Employee(**item) for item in validated_data if item['employee_number'] not in existing],
+                batch_size=500)
+            updated = self.bulk_update([(existing[item['employee_number']], item) for item in validated_data
+                                        if item['employee_number'] in existing])
+        return created + updated
+
+    def update(self, instances, validated_data):
+        instances = {instance.id: instance for instance in instances}
+        with transaction.atomic():
+            return self.bulk_update([(instances[item['id']], {key: value for key, value in item.items()
+                                                              if key != 'id'}) for item in validated_data])
+
+    def bulk_update(self, changes):
+        """
+        changes为[(员工, 要更新的字段和值), ...]，所有员工用一次bulk_update写入。
+        """
+        fields = set()
+        for instance, item in changes:
+            for key, value in item.items():
+                setattr(instance, key, value)
+            fields.update(item)
+        if changes and fields:
+            Employee.objects.bulk_update([instance for instance, item in changes], sorted(fields), batch_size=500)
+        return [instance for instance, item in changes]
+
+
+class EmployeeBulkSerializer(EmployeeSerializer):
+    id = serializers.IntegerField(required=False)  # 批量更新时指定要更新的员工
+
+    class Meta(EmployeeSerializer.Meta):
+        list_serializer_class = EmployeeBulkListSerializer
+        # 工号的唯一性由EmployeeBulkListSerializer统一检查，不逐行查询数据库
+        extra_kwargs = {'employee_number': {'validators': []}}
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    storage.py
+# @Time:    2024/03/12
+"""
+按内容哈希命名的文件存储
+
+保存文件时在文件名中加入内容的SHA-256摘要，例如images/糖醋里脊.3f2a9c1b7d4e.jpg：
+- 文件内容不变，URL就不变，媒体服务可以返回一年有效期的immutable缓存头；
+- 同一张图片重复上传时文件名相同，直接复用已有文件，磁盘上不会出现第二份。
+"""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+HASH_LENGTH = 12
+
+
+class HashedFileSystemStorage(FileSystemStorage):
+
+    def get_hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        root, ext = os.path.splitext(name)
+        return f'{root}.{digest.hexdigest()[:HASH_LENGTH]}{ext}'
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_hashed_name(name, content)
+        # 内容相同的文件已经存在，直接复用
+        if self.exists(name):
+            return name.replace('\\', '/')
+        return super().save(name, content, max_length=max_length)
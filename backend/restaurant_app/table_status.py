@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    table_status.py
+# @Time:    2024/03/29
+"""
+桌位占用状态
+
+get_table_status用一条查询返回每张桌子是否有未结账的订单、用餐人数、未结账金额和入座时间，
+订单或菜品详情变化时，models.py中的信号在事务提交后重新查询相关桌位并通过table_status_channel广播，
+只有状态真正变化时才发布，SSE接口只推送变化的桌位。没有客户端订阅时不做任何查询。
+"""
+import threading
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Count, FilteredRelation, Min, Q, Sum
+
+from .events import Broadcaster
+
+OPEN_STATUS = '未结账'
+
+table_status_channel = Broadcaster()
+
+# 最近一次发布的各桌位状态，用于判断状态是否变化
+_last_status = {}
+_last_status_lock = threading.Lock()
+
+
+def get_table_status(table_ids=None):
+    """
+    返回各桌位的占用状态，按桌号排列；指定table_ids时只返回这些桌位。
+    未结账的订单通过LEFT JOIN的连接条件筛选，使用订单的(transaction_status, table)索引，不扫描已结账的历史订单。
+    """
+    from .models import Table
+
+    queryset = Table.objects.annotate(open_order=FilteredRelation(
+        'order', condition=Q(order__transaction_status=OPEN_STATUS)))
+    if table_ids is not None:
+        queryset = queryset.filter(id__in=table_ids)
+    rows = queryset.values('id', 'table_number').annotate(
+        open_orders=Count('open_order'),
+        party_size=Sum('open_order__number_of_people'),
+        open_total=Sum('open_order__total_amount'),
+        seated_at=Min('open_order__transaction_time'),
+    ).order_by('table_number')
+
+    now = datetime.now()
+    return [{
+        'id': row['id'],
+        'table_number': row['table_number'],
+        'occupied': row['open_orders'] > 0,
+        'open_orders': row['open_orders'],
+        'party_size': row['party_size'] or 0,
+        'open_total': f'{row["open_total"] or 0:.2f}',
+        'seated_at': row['seated_at'],
+        'seated_minutes': int((now - row['seated_at']).total_seconds() // 60) if row['seated_at'] else None,
+    } for row in rows]
+
+
+def status_key(status):
+    # 入座时长随时间变化，不作为状态是否变化的依据
+    return {key: value for key, value in status.items() if key != 'seated_minutes'}
+
+
+def publish_table_status(table_ids):
+    """
+    重新查询指定桌位的状态，广播其中发生变化的桌位。
+    """
+    if not table_status_channel.subscriber_count:
+        # 没有订阅者时不发布，之前记录的状态可能已经过时
+        with _last_status_lock:
+            _last_status.clear()
+        return
+    for status in get_table_status(table_ids):
+        key = status_key(status)
+        with _last_status_lock:
+            if _last_status.get(status['id']) == key:
+                continue
+            _last_status[status['id']] = key
+        table_status_channel.publish(status)
+
+
+def schedule_table_status(table_id=None, order_id=None):
+    """
+    在当前事务提交后发布桌位状态，可以指定桌位id或订单id。
+    """
+    def publish():
+        table_ids = [table_id]
+        if table_id is None and table_status_channel.subscriber_count:
+            from .models import Order
+            table_ids = list(Order.objects.filter(pk=order_id).values_list('table_id', flat=True))
+        publish_table_status(table_ids)
+
+    transaction.on_commit(publish)
@@ -1,3 +1,1263 @@
-from django.test import TestCase
+import asyncio
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import csv
+import os
+import json
+import shutil
+import sqlite3
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+from urllib.parse import quote, unquote
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from PIL import Image
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient, APITestCase
+
+from .cache import bump_data_version, get_cache, get_data_version
+from .db_routers import ReplicaRouter, use_replica
+from .management.commands.benchmark_endpoints import Command as BenchmarkCommand, get_endpoints
+from .images import generate_variants, get_variant_paths
+from .views import OrderViewSet, get_calendar_range
+from .models import Table, DishCategory, DishUnit, DishImage, Dish, Order, DishDetail, DailyDishSales, Employee
+
+
+def create_menu(dish_count=3):
+    """
+    创建测试用的桌位、分类、单位、图片和菜品，返回菜品列表。
+    """
+    table = Table.objects.create(table_number=1)
+    category = DishCategory.objects.create(category='热菜')
+    unit = DishUnit.objects.create(unit='份')
+    dishes = []
+    for i in range(dish_count):
+        image = DishImage.objects.create(file=f'images/dish{i}.jpg', name=f'dish{i}')
+        dishes.append(Dish.objects.create(category=category, specification='精品', file=image, name=f'菜品{i}',
+                                          unit=unit, price=Decimal('10.00') * (i + 1)))
+    return table, dishes
+
+
+# 订单总价增量维护测试
+class OrderTotalAmountTests(TestCase):
+    def setUp(self):
+        self.table, self.dishes = create_menu()
+        self.order = Order.objects.create(table=self.table, number_of_people=2)
+
+    def assertTotal(self, order, expected):
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal(expected))
+
+    def test_create_update_delete(self):
+        detail = DishDetail.objects.create(dish=self.dishes[0], order=self.order, quantity=2)
+        DishDetail.objects.create(dish=self.dishes[1], order=self.order, quantity=1)
+        self.assertTotal(self.order, '40.00')
+
+        detail.quantity = 3
+        detail.save()
+        self.assertTotal(self.order, '50.00')
+
+        detail.delete()
+        self.assertTotal(self.order, '20.00')
+
+    def test_order_update_keeps_total(self):
+        DishDetail.objects.create(dish=self.dishes[0], order=self.order, quantity=1)
+        get_object = OrderViewSet.get_object
+
+        def load_then_add_line(view):
+            # 请求读取订单之后，另一个请求又加了一道菜
+            order = get_object(view)
+            DishDetail.objects.create(dish=self.dishes[1], order=self.order, quantity=1)
+            return order
+
+        with mock.patch.object(OrderViewSet, 'get_object', load_then_add_line):
+            response = APIClient().patch(f'/api/order/{self.order.pk}/',
+                                         {'transaction_status': '已结账', 'total_amount': '1.00'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_amount'], '30.00')
+        self.assertTotal(self.order, '30.00')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.transaction_status, '已结账')
+
+    def test_move_line_to_another_order(self):
+        other = Order.objects.create(table=self.table, number_of_people=4)
+        detail = DishDetail.objects.create(dish=self.dishes[2], order=self.order, quantity=1)
+        detail.order = other
+        detail.save()
+        self.assertTotal(self.order, '0.00')
+        self.assertTotal(other, '30.00')
+
+    def test_one_write_per_line(self):
+        DishDetail.objects.create(dish=self.dishes[0], order=self.order, quantity=1)
+        dish = Dish.objects.select_related('unit').get(pk=self.dishes[0].pk)  # 复制快照需要菜品的单位
+        # 插入菜品详情 + 一条UPDATE订单总价 + 一条UPDATE菜品每日销量汇总
+        with self.assertNumQueries(3):
+            DishDetail.objects.create(dish=dish, order=self.order, quantity=1)
+
+    def test_snapshot_survives_menu_changes(self):
+        detail = DishDetail.objects.create(dish=self.dishes[0], order=self.order, quantity=2)
+        self.assertEqual((detail.name, detail.unit, detail.specification, detail.unit_price),
+                         ('菜品0', '份', '精品', Decimal('10.00')))
+        Dish.objects.filter(pk=self.dishes[0].pk).update(name='新菜品', price=Decimal('99.00'))
+        detail.refresh_from_db()
+        detail.quantity = 3
+        detail.save()  # 按下单时的单价重新计算总价
+        self.assertEqual((detail.name, detail.total_price), ('菜品0', Decimal('30.00')))
+
+        self.dishes[0].delete()
+        detail.refresh_from_db()
+        self.assertIsNone(detail.dish_id)
+        self.assertEqual(detail.name, '菜品0')
+        self.assertTotal(self.order, '30.00')
+        response = APIClient().get(f'/api/order/{self.order.pk}/')
+        self.assertEqual(response.data['dish_details'][0]['name'], '菜品0')
+
+    def test_api_requires_dish(self):
+        client = APIClient()
+        response = client.post('/api/dish-detail/', {'order': self.order.pk, 'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('dish', response.data['msg'])
+        response = client.post('/api/dish-detail/', {'order': self.order.pk, 'dish': None, 'quantity': 2},
+                               format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_save_line_without_price(self):
+        # 菜品已被删除且没有快照单价的菜品详情，保存时按总价为0计算增量
+        detail = DishDetail.objects.create(dish=self.dishes[0], order=self.order, quantity=1)
+        DishDetail.objects.filter(pk=detail.pk).update(dish=None, unit_price=None, total_price=None)
+        detail.refresh_from_db()
+        detail.quantity = 2
+        detail.save()
+        self.assertTotal(self.order, '10.00')
+        response = APIClient().patch(f'/api/dish-detail/{detail.pk}/', {'quantity': 3}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_backfill_snapshots(self):
+        detail = DishDetail.objects.create(dish=self.dishes[1], order=self.order, quantity=2)
+        Dish.objects.filter(pk=self.dishes[1].pk).update(price=Decimal('25.00'))
+        DishDetail.objects.filter(pk=detail.pk).update(name='', unit='', specification='', unit_price=None)
+
+        call_command('backfill_dish_detail_snapshots', stdout=StringIO())
+        detail.refresh_from_db()
+        # 单价来自下单时记录的总价，而不是菜品当前的单价
+        self.assertEqual((detail.name, detail.unit, detail.specification, detail.unit_price),
+                         ('菜品1', '份', '精品', Decimal('20.00')))
+
+    def test_repair_order_totals(self):
+        DishDetail.objects.create(dish=self.dishes[0], order=self.order, quantity=1)
+        Order.objects.filter(pk=self.order.pk).update(total_amount=Decimal('999.00'))
+        empty = Order.objects.create(table=self.table, number_of_people=1)
+
+        out = StringIO()
+        call_command('repair_order_totals', '--dry-run', stdout=out)
+        self.assertIn('1', out.getvalue())
+        self.assertTotal(self.order, '999.00')
+
+        cache.clear()
+        statistics = APIClient().get('/api/order/total-amount-statistics/').data
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('repair_order_totals', stdout=StringIO())
+        self.assertTotal(self.order, '10.00')
+        # 修复后统计接口的缓存失效
+        self.assertNotEqual(APIClient().get('/api/order/total-amount-statistics/').data, statistics)
+        empty.refresh_from_db()
+        self.assertIsNone(empty.total_amount)
+
+
+# 一次性提交订单接口测试
+class OrderSubmitTests(APITestCase):
+    def setUp(self):
+        self.table, self.dishes = create_menu()
+
+    def test_submit_order(self):
+        payload = {'table': self.table.id, 'number_of_people': 3,
+                   'dishes': [{'dish': self.dishes[0].id, 'quantity': 2}, {'dish': self.dishes[2].id, 'quantity': 1}]}
+        response = self.client.post('/api/order/submit/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(order.total_amount, Decimal('50.00'))
+        self.assertEqual(sorted(order.dishdetail_set.values_list('total_price', flat=True)),
+                         [Decimal('20.00'), Decimal('30.00')])
+        self.assertEqual(len(response.data['dish_details']), 2)
+
+    def test_submit_rejects_unknown_or_off_sale_dish(self):
+        Dish.objects.filter(pk=self.dishes[1].pk).update(is_on_sale=False)
+        payload = {'table': self.table.id, 'number_of_people': 1,
+                   'dishes': [{'dish': self.dishes[1].id, 'quantity': 1}, {'dish': 9999, 'quantity': 1}]}
+        response = self.client.post('/api/order/submit/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+# 订单列表和详情接口的查询次数测试，查询次数不随菜品详情数量增长
+class OrderQueryCountTests(APITestCase):
+    def setUp(self):
+        self.table, self.dishes = create_menu()
+
+    def create_orders(self, order_count, line_count):
+        for _ in range(order_count):
+            order = Order.objects.create(table=self.table, number_of_people=2)
+            DishDetail.objects.bulk_create(
+                DishDetail(dish=self.dishes[i % len(self.dishes)], order=order, quantity=1, total_price=Decimal('10'))
+                for i in range(line_count))
+        return order
+
+    def test_list_query_count(self):
+        for line_count in (1, 20):
+            with self.subTest(line_count=line_count):
+                Order.objects.all().delete()
+                self.create_orders(10, line_count)
+                # COUNT + 订单 + 菜品详情(快照字段，不关联菜品)
+                with self.assertNumQueries(3):
+                    response = self.client.get('/api/order/')
+                self.assertEqual(len(response.data['results']), 10)
+                self.assertEqual(len(response.data['results'][0]['dish_details']), line_count)
+
+    def test_retrieve_query_count(self):
+        for line_count in (1, 20):
+            with self.subTest(line_count=line_count):
+                order = self.create_orders(1, line_count)
+                with self.assertNumQueries(2):
+                    response = self.client.get(f'/api/order/{order.id}/')
+                self.assertEqual(len(response.data['dish_details']), line_count)
+
+
+# 菜品列表接口的查询次数测试，查询次数不随每页菜品数量增长
+class DishQueryCountTests(APITestCase):
+    def test_list_query_count(self):
+        create_menu(dish_count=12)
+        for page, row_count in ((1, 10), (2, 2)):
+            with self.subTest(page=page):
+                # COUNT + 菜品(JOIN分类、单位和图片)
+                with self.assertNumQueries(2):
+                    response = self.client.get('/api/dish/', {'page': page})
+                results = response.data['results']
+                self.assertEqual(len(results), row_count)
+                self.assertTrue(results[0]['dish_url'].startswith('http://testserver/media/images/'))
+
+
+# 菜品每日销量汇总表测试
+class DailyDishSalesTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.table, self.dishes = create_menu()
+        self.order = Order.objects.create(table=self.table, number_of_people=2)
+
+    def rollup(self):
+        return {(row.date, row.dish_id): (row.quantity, row.revenue) for row in DailyDishSales.objects.all()}
+
+    def test_rollup_follows_dish_detail_changes(self):
+        today = datetime.now().date()
+        detail = DishDetail.objects.create(dish=self.dishes[0], order=self.order, quantity=2)
+        DishDetail.objects.create(dish=self.dishes[0], order=self.order, quantity=1)
+        self.assertEqual(self.rollup(), {(today, self.dishes[0].id): (3, Decimal('30.00'))})
+
+        detail.dish = self.dishes[1]
+        detail.save()
+        self.assertEqual(self.rollup(), {(today, self.dishes[0].id): (1, Decimal('10.00')),
+                                         (today, self.dishes[1].id): (2, Decimal('40.00'))})
+
+        detail.delete()
+        self.assertEqual(self.rollup()[today, self.dishes[1].id], (0, Decimal('0.00')))
+
+        self.client.post('/api/order/submit/', {'table': self.table.id, 'number_of_people': 1, 'dishes': [
+            {'dish': self.dishes[2].id, 'quantity': 1}, {'dish': self.dishes[2].id, 'quantity': 2}]}, format='json')
+        self.assertEqual(self.rollup()[today, self.dishes[2].id], (3, Decimal('90.00')))
+
+    def test_no_negative_rollup_rows(self):
+        detail = DishDetail.objects.create(dish=self.dishes[0], order=self.order, quantity=3)
+        DailyDishSales.objects.all().delete()  # 该日期还没有汇总行
+        detail.quantity = 1
+        detail.save()
+        self.assertFalse(DailyDishSales.objects.exists())
+        detail.delete()
+        self.assertFalse(DailyDishSales.objects.exists())
+
+    def test_rollup_follows_dish_category(self):
+        DishDetail.objects.create(dish=self.dishes[0], order=self.order, quantity=2)
+        DishDetail.objects.filter(order=self.order).update(order_time=datetime.now() - timedelta(days=3))
+        DishDetail.objects.create(dish=self.dishes[0], order=self.order, quantity=1)
+        call_command('rebuild_daily_sales', stdout=StringIO())
+        cold = DishCategory.objects.create(category='凉菜')
+        self.dishes[0].category = cold
+        self.dishes[0].save()
+        self.assertEqual(set(DailyDishSales.objects.filter(dish=self.dishes[0]).values_list('category', flat=True)),
+                         {cold.pk})
+        # 汇总表的完整日期和原始数据的当天都计入新分类
+        response = self.client.get('/api/dish-category/sales-rank/', {'period': 'week'})
+        self.assertEqual([(item['category'], [day['total_sales'] for day in item['data']]) for item in response.data],
+                         [('凉菜', [2, 1])])
+
+    def test_rebuild_invalidates_cache(self):
+        DishDetail.objects.create(dish=self.dishes[0], order=self.order, quantity=1)
+        DishDetail.objects.filter(order=self.order).update(order_time=datetime.now() - timedelta(days=3))
+        DailyDishSales.objects.all().delete()
+        self.assertEqual(self.client.get('/api/dish/sales-rank/', {'period': 'week'}).data, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_daily_sales', stdout=StringIO())
+        response = self.client.get('/api/dish/sales-rank/', {'period': 'week'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data, [{'name': '菜品0', 'total_sales': 1}])
+
+    def test_sales_rank_from_rollup(self):
+        for dish, quantity in ((self.dishes[0], 1), (self.dishes[1], 3), (self.dishes[2], 2)):
+            DishDetail.objects.create(dish=dish, order=self.order, quantity=quantity)
+        old = DishDetail.objects.create(dish=self.dishes[0], order=self.order, quantity=5)
+        DishDetail.objects.filter(pk=old.pk).update(order_time=datetime.now() - timedelta(days=3))
+        call_command('rebuild_daily_sales', stdout=StringIO())
+        self.assertEqual(DailyDishSales.objects.filter(dish=self.dishes[0]).count(), 2)
+
+        response = self.client.get('/api/dish/sales-rank/', {'period': 'week'})
+        self.assertEqual(response.data, [{'name': '菜品0', 'total_sales': 6}, {'name': '菜品1', 'total_sales': 3},
+                                         {'name': '菜品2', 'total_sales': 2}])
+        response = self.client.get('/api/dish/sales-rank/', {'period': 'day'})
+        self.assertEqual([item['name'] for item in response.data], ['菜品1', '菜品2', '菜品0'])
+
+        response = self.client.get('/api/dish-category/sales-rank/', {'period': 'week'})
+        self.assertEqual(response.data[0]['category'], '热菜')
+        self.assertEqual([item['total_sales'] for item in response.data[0]['data']], [5, 6])
+
+
+# 订单总价区间统计测试
+class TotalAmountStatisticsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        table = Table.objects.create(table_number=1)
+        for total_amount in (None, 50, 199.99, 200, 950, 2500):
+            Order.objects.create(table=table, number_of_people=2, total_amount=total_amount)
+
+    def test_default_buckets(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/order/total-amount-statistics/', {'period': 'day'})
+        self.assertEqual(len(response.data), 11)
+        self.assertEqual(response.data[0], {'ranges': '0-200', 'statistics': 2})
+        self.assertEqual(response.data[1], {'ranges': '200-400', 'statistics': 1})
+        self.assertEqual(response.data[4], {'ranges': '800-1000', 'statistics': 1})
+        self.assertEqual(response.data[10], {'ranges': '2000-inf', 'statistics': 1})
+
+    def test_custom_buckets(self):
+        response = self.client.get('/api/order/total-amount-statistics/', {'period': 'day', 'buckets': '100,1000'})
+        self.assertEqual(response.data, [{'ranges': '100-1000', 'statistics': 3},
+                                         {'ranges': '1000-inf', 'statistics': 1}])
+        response = self.client.get('/api/order/total-amount-statistics/', {'period': 'day', 'buckets': '500,100'})
+        self.assertEqual(response.status_code, 400)
+
+
+# 统计接口缓存测试
+class AnalyticsCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.table, self.dishes = create_menu()
+
+    def test_cached_until_data_changes(self):
+        url = '/api/dish/sales-rank/'
+        response = self.client.get(url, {'period': 'day'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data, [])
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'period': 'day'})
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(url, {'period': 'week'})['X-Cache'], 'MISS')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(table=self.table, number_of_people=1)
+            DishDetail.objects.create(dish=self.dishes[0], order=order, quantity=2)
+        response = self.client.get(url, {'period': 'day'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data, [{'name': '菜品0', 'total_sales': 2}])
+
+        self.assertEqual(self.client.get('/api/analytics-cache/').data['hits'], 1)
+        self.assertEqual(self.client.get('/api/analytics-cache/').data['misses'], 3)
+
+    def test_error_response_not_cached(self):
+        self.assertEqual(self.client.get('/api/dish/sales-rank/', {'period': 'year'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/dish/sales-rank/', {'period': 'year'})['X-Cache'], 'MISS')
+
+    def test_bump_without_incr(self):
+        # 版本号直接写入新值，不依赖缓存后端的incr是否为原子操作
+        with mock.patch('restaurant_app.cache.time.time_ns', return_value=100):
+            versions = [get_data_version()]
+            for _ in range(2):
+                with self.captureOnCommitCallbacks(execute=True), \
+                        mock.patch.object(type(get_cache()), 'incr', side_effect=AssertionError):
+                    bump_data_version()
+                versions.append(get_data_version())
+        self.assertEqual(versions, [100, 101, 102])
+
+
+# 基础数据接口ETag条件请求测试
+class ConditionalListTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.table, self.dishes = create_menu()
+
+    def test_not_modified_without_queries(self):
+        for url in ('/api/table/', '/api/dish-category/', '/api/dish-unit/', '/api/dish/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_etag_changes_on_write(self):
+        etag = self.client.get('/api/dish/')['ETag']
+        self.assertNotEqual(self.client.get('/api/dish/', {'page': 1})['ETag'], etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            DishUnit.objects.filter(pk=self.dishes[0].unit_id).first().save()
+        response = self.client.get('/api/dish/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+# 订单游标分页测试
+class OrderCursorPaginationTests(APITestCase):
+    def setUp(self):
+        self.table, self.dishes = create_menu()
+        other = Table.objects.create(table_number=2)
+        for i in range(25):
+            Order.objects.create(table=self.table if i % 5 else other, number_of_people=2)
+
+    def test_stable_paging_with_filters(self):
+        expected = list(Order.objects.filter(table=self.table).order_by('-transaction_time', '-id')
+                        .values_list('id', flat=True))
+        seen = []
+        response = self.client.get('/api/order/', {'pagination': 'cursor', 'table_number': 1})
+        with CaptureQueriesContext(connection) as queries:
+            while True:
+                seen += [order['id'] for order in response.data['results']]
+                # 翻页过程中插入的新订单不影响后续页
+                Order.objects.create(table=self.table, number_of_people=1)
+                if not response.data['next']:
+                    break
+                response = self.client.get(response.data['next'])
+        self.assertEqual(seen, expected)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+
+
+# 热点查询的执行计划测试：订单和菜品详情表上的时间段和桌号过滤不能退化为全表扫描
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN只适用于SQLite')
+class QueryPlanTests(APITestCase):
+    hot_tables = ('restaurant_app_order', 'restaurant_app_dishdetail', 'restaurant_app_dailydishsales')
+
+    def setUp(self):
+        cache.clear()
+        self.table, self.dishes = create_menu()
+        for i in range(20):
+            order = Order.objects.create(table=self.table, number_of_people=2)
+            DishDetail.objects.create(dish=self.dishes[i % 3], order=order, quantity=1)
+
+    def assertNoFullScan(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        with connection.cursor() as cursor:
+            for query in queries:
+                cursor.execute(f'EXPLAIN QUERY PLAN {query["sql"]}')
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    scans = [table for table in self.hot_tables if detail.startswith(f'SCAN {table}')]
+                    self.assertFalse(scans and 'INDEX' not in detail, f'{url}: {detail}\n{query["sql"]}')
+
+    def test_hot_queries_use_indexes(self):
+        today = datetime.now().date()
+        start, end = (today - timedelta(days=30)).isoformat(), (today + timedelta(days=1)).isoformat()
+        for url, params in (
+                ('/api/order/', {'start_time': start, 'end_time': end}),
+                ('/api/order/', {'start_time': start, 'end_time': end, 'table_number': 1}),
+                ('/api/order/', {'table_number': 1}),
+                ('/api/order/', {'table_number': 1, 'pagination': 'cursor'}),
+                ('/api/order/total-amount-statistics/', {'period': 'week'}),
+                ('/api/dish/sales-rank/', {'period': 'day'}),
+                ('/api/dish/sales-rank/', {'period': 'month'}),
+                ('/api/dish-category/sales-rank/', {'period': 'week'})):
+            with self.subTest(url=url, params=params):
+                self.assertNoFullScan(url, params)
+
+
+# 订单流式导出测试
+class OrderExportTests(APITestCase):
+    def setUp(self):
+        self.table, self.dishes = create_menu()
+        other = Table.objects.create(table_number=2)
+        self.order = Order.objects.create(table=self.table, number_of_people=2)
+        for dish in self.dishes[:2]:
+            DishDetail.objects.create(dish=dish, order=self.order, quantity=1)
+        Order.objects.create(table=self.table, number_of_people=1)
+        Order.objects.create(table=other, number_of_people=3)
+
+    def get_content(self, params):
+        response = self.client.get('/api/order/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8-sig')
+
+    def test_csv(self):
+        rows = list(csv.reader(StringIO(self.get_content({'type': 'csv', 'table_number': 1}))))
+        self.assertEqual(rows[0][:3], ['order_id', 'transaction_time', 'table_number'])
+        # 两个菜品详情各一行，没有菜品详情的订单一行
+        self.assertEqual(len(rows), 4)
+        self.assertEqual([row[7] for row in rows[1:] if row[0] == str(self.order.id)], ['菜品0', '菜品1'])
+
+    def test_ndjson(self):
+        orders = [json.loads(line) for line in self.get_content({'type': 'ndjson'}).splitlines()]
+        self.assertEqual(len(orders), 3)
+        exported = next(order for order in orders if order['order_id'] == self.order.id)
+        self.assertEqual(exported['total_amount'], '30.00')
+        self.assertEqual([detail['name'] for detail in exported['dish_details']], ['菜品0', '菜品1'])
+        self.assertEqual(sum(len(order['dish_details']) for order in orders), 2)
+
+    def test_invalid_type(self):
+        self.assertEqual(self.client.get('/api/order/export/', {'type': 'xml'}).status_code, 400)
+
+
+# 菜品图片多尺寸版本测试
+@override_settings(IMAGE_VARIANTS_ASYNC=False, IMAGE_VARIANTS={'thumbnail': 40, 'card': 120})
+class DishImageVariantTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def make_jpeg(self, name='红烧肉.jpg', size=(600, 300)):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, format='JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_generates_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/dish-image/', {'file': self.make_jpeg()}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        image = DishImage.objects.get(pk=response.data['id'])
+        self.assertEqual(set(image.variants), {'thumbnail', 'card'})
+        with default_storage.open(image.variants['card']['webp']) as file:
+            self.assertEqual(Image.open(file).size, (120, 60))
+        with default_storage.open(image.variants['thumbnail']['jpeg']) as file:
+            self.assertEqual(Image.open(file).size, (40, 20))
+
+        Dish.objects.create(category=DishCategory.objects.create(category='热菜'), file=image, name='红烧肉',
+                            unit=DishUnit.objects.create(unit='份'), price=Decimal('48.00'))
+        variants = self.client.get('/api/dish/').data['results'][0]['dish_variants']
+        self.assertTrue(variants['thumbnail']['webp'].startswith('http://testserver/media/images/variants/'))
+
+    def test_regenerate_deletes_stale_variants(self):
+        red = default_storage.save('images/red.jpg', self.make_jpeg())
+        first = DishImage.objects.create(file=red)
+        second = DishImage.objects.create(file=red)
+        for image in (first, second):
+            generate_variants(image.pk)
+            image.refresh_from_db()
+        old_paths = get_variant_paths(first.variants)
+        self.assertEqual(old_paths, get_variant_paths(second.variants))  # 内容相同，共用同一组文件
+
+        buffer = BytesIO()
+        Image.new('RGB', (600, 300), 'blue').save(buffer, format='JPEG')
+        blue = default_storage.save('images/blue.jpg', ContentFile(buffer.getvalue()))
+        DishImage.objects.filter(pk=first.pk).update(file=blue)
+        generate_variants(first.pk)
+        self.assertTrue(all(default_storage.exists(path) for path in old_paths))  # 仍被second引用
+
+        DishImage.objects.filter(pk=second.pk).update(file=blue)
+        generate_variants(second.pk)
+        self.assertFalse(any(default_storage.exists(path) for path in old_paths))
+        second.refresh_from_db()
+        self.assertTrue(all(default_storage.exists(path) for path in get_variant_paths(second.variants)))
+
+    def test_backfill_command(self):
+        for i in range(3):
+            DishImage.objects.create(file=default_storage.save(f'images/dish{i}.jpg', self.make_jpeg()))
+        call_command('generate_image_variants', '--workers', '2', stdout=StringIO())
+        self.assertFalse(DishImage.objects.filter(variants={}).exists())
+        self.assertTrue(all(default_storage.exists(image.variants['card']['jpeg'])
+                            for image in DishImage.objects.all()))
+
+        # 重新生成全部图片后，不再使用的旧版本文件被删除
+        card_paths = {path for image in DishImage.objects.all() for path in image.variants['card'].values()}
+        with override_settings(IMAGE_VARIANTS={'thumbnail': 40}):
+            call_command('generate_image_variants', '--all', stdout=StringIO())
+        self.assertFalse(any(default_storage.exists(path) for path in card_paths))
+        self.assertTrue(all(default_storage.exists(path) for image in DishImage.objects.all()
+                            for path in get_variant_paths(image.variants)))
+
+
+# 媒体文件服务测试
+class MediaServingTests(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root, IMAGE_VARIANTS_ASYNC=False))
+
+    def upload(self):
+        buffer = BytesIO()
+        Image.new('RGB', (64, 64), 'blue').save(buffer, format='JPEG')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/dish-image/', {'file': SimpleUploadedFile('鱼香肉丝.jpg', buffer.getvalue())},
+                                        format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return DishImage.objects.get(pk=response.data['id'])
+
+    def test_same_content_stored_once(self):
+        first, second = self.upload(), self.upload()
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertRegex(first.file.name, r'^images/鱼香肉丝\.[0-9a-f]{12}\.jpg$')
+        self.assertEqual(len([name for name in os.listdir(os.path.join(self.media_root, 'images'))
+                              if name.endswith('.jpg')]), 1)
+
+    def test_conditional_and_range_requests(self):
+        url = self.upload().file.url
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        body = b''.join(response.streaming_content)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=self.client.get(url)['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(body)}')
+        self.assertEqual(b''.join(response.streaming_content), body[10:20])
+        response = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), body[-5:])
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(body)}-').status_code, 416)
+
+    def test_accel_redirect_quotes_path(self):
+        image = self.upload()
+        with override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/'):
+            response = self.client.get(image.file.url)
+        self.assertEqual(response.status_code, 200)
+        redirect = response['X-Accel-Redirect']
+        self.assertTrue(redirect.isascii())
+        self.assertEqual(redirect, '/protected-media/' + quote(image.file.name))
+        self.assertEqual(unquote(redirect), f'/protected-media/{image.file.name}')
+
+    def test_precompressed_and_plain_files(self):
+        os.makedirs(os.path.join(self.media_root, 'docs'))
+        for name, content in (('menu.txt', b'plain'), ('menu.txt.gz', b'gzipped')):
+            with open(os.path.join(self.media_root, 'docs', name), 'wb') as file:
+                file.write(content)
+        response = self.client.get('/media/docs/menu.txt', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(b''.join(response.streaming_content), b'gzipped')
+        gzip_etag = response['ETag']
+        response = self.client.get('/media/docs/menu.txt')
+        self.assertEqual(b''.join(response.streaming_content), b'plain')
+        # 不同编码的表示使用不同的ETag
+        self.assertNotEqual(response['ETag'], gzip_etag)
+        self.assertEqual(self.client.get('/media/docs/menu.txt', HTTP_IF_NONE_MATCH=gzip_etag).status_code, 200)
+        self.assertEqual(self.client.get('/media/docs/menu.txt', HTTP_ACCEPT_ENCODING='gzip',
+                                         HTTP_IF_NONE_MATCH=gzip_etag).status_code, 304)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+
+
+# 压测数据生成命令测试
+class GenerateLoadDataTests(TestCase):
+    def test_generate(self):
+        call_command('generate_load_data', '--seed', '7', '--tables', '3', '--days', '5', '--dishes', '10',
+                     '--employees', '4', '--batch-size', '20', stdout=StringIO())
+        self.assertEqual(Table.objects.count(), 3)
+        self.assertEqual(Dish.objects.count(), 10)
+        self.assertTrue(Order.objects.exists())
+        self.assertFalse(Order.objects.filter(dishdetail__isnull=True).exists())
+        self.assertLess(Order.objects.order_by('transaction_time').first().transaction_time.date(),
+                        datetime.now().date())
+        # 订单总价和每日销量汇总都与菜品详情一致
+        out = StringIO()
+        call_command('repair_order_totals', '--dry-run', stdout=out)
+        self.assertIn('所有订单总价均一致', out.getvalue())
+        self.assertEqual(DailyDishSales.objects.aggregate(total=Sum('quantity'))['total'],
+                         DishDetail.objects.aggregate(total=Sum('quantity'))['total'])
+
+    def snapshot(self):
+        return {
+            'dishes': list(Dish.objects.order_by('name').values_list(
+                'name', 'category__category', 'unit__unit', 'specification', 'price')),
+            'employees': list(Employee.objects.order_by('employee_number').values_list(
+                'employee_number', 'name', 'gender', 'position')),
+            'orders': list(Order.objects.order_by('transaction_time', 'id').values_list(
+                'transaction_time', 'table__table_number', 'number_of_people', 'transaction_status', 'total_amount')),
+            'lines': list(DishDetail.objects.order_by('order__transaction_time', 'id').values_list(
+                'order__transaction_time', 'order_time', 'name', 'quantity', 'total_price', 'unit_price')),
+        }
+
+    def test_same_seed_same_data(self):
+        now = datetime.now()
+
+        # 固定当前时间，两次运行生成的时间范围相同
+        class FrozenDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return now
+
+        class FrozenDate(date):
+            @classmethod
+            def today(cls):
+                return now.date()
+
+        module = 'restaurant_app.management.commands.generate_load_data'
+        snapshots = []
+        with mock.patch(f'{module}.datetime', FrozenDatetime), mock.patch(f'{module}.date', FrozenDate):
+            for _ in range(2):
+                for model in (Order, Dish, DishImage, DishCategory, DishUnit, Table, Employee, DailyDishSales):
+                    model.objects.all().delete()
+                call_command('generate_load_data', '--seed', '7', '--tables', '3', '--days', '5', '--dishes', '10',
+                             '--employees', '4', stdout=StringIO())
+                snapshots.append(self.snapshot())
+        self.assertTrue(snapshots[0]['lines'])
+        self.assertEqual(snapshots[0], snapshots[1])
+
+
+# 基准测试报告比较测试
+class BenchmarkCompareTests(SimpleTestCase):
+    def setUp(self):
+        self.baseline = {'results': {'small': {'order-list': {'p95_ms': 10.0, 'queries': 3}}}}
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def report(self, p95_ms, queries=3):
+        return {'results': {'small': {'order-list': {'p95_ms': p95_ms, 'queries': queries},
+                                      'dish-list': {'p95_ms': 100.0, 'queries': 9}}}}
+
+    def write_baseline(self, content, name='baseline.json'):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_within_threshold(self):
+        command = BenchmarkCommand()
+        # 增加的比例在阈值以内；超过比例但增加的毫秒数很小；基准中没有的接口不比较
+        self.assertEqual(command.compare(self.baseline, self.report(12.0), 0.25, 2.0), [])
+        self.assertEqual(command.compare(self.baseline, self.report(11.5), 0.1, 2.0), [])
+        self.assertEqual(command.compare(self.baseline, self.report(4.0, queries=2), 0.25, 2.0), [])
+
+    def test_regression(self):
+        command = BenchmarkCommand()
+        self.assertEqual(command.compare(self.baseline, self.report(13.0), 0.25, 2.0),
+                         ['[small] order-list: p95 10.0ms -> 13.0ms'])
+        self.assertEqual(command.compare(self.baseline, self.report(10.0, queries=4), 0.25, 2.0),
+                         ['[small] order-list: 查询次数 3 -> 4'])
+
+        # 命令以错误退出
+        path = self.write_baseline(json.dumps(self.baseline))
+        with mock.patch.object(BenchmarkCommand, 'run_scale', return_value=self.report(13.0)['results']['small']):
+            with self.assertRaisesMessage(CommandError, '1个接口性能退化'):
+                call_command('benchmark_endpoints', '--scales', 'small', '--baseline', path,
+                             stdout=StringIO(), stderr=StringIO())
+            out = StringIO()
+            call_command('benchmark_endpoints', '--scales', 'small', '--baseline', path, '--threshold', '0.5',
+                         stdout=out)
+        self.assertIn('没有性能退化', out.getvalue())
+
+    def test_invalid_baseline(self):
+        paths = [
+            os.path.join(self.directory, 'missing.json'),
+            self.write_baseline('{"results": ', 'truncated.json'),
+            self.write_baseline('[]', 'list.json'),
+        ]
+        with mock.patch.object(BenchmarkCommand, 'run_scale') as run_scale:
+            for path in paths:
+                with self.subTest(path=path), self.assertRaises(CommandError):
+                    call_command('benchmark_endpoints', '--scales', 'small', '--baseline', path, stdout=StringIO())
+        # 在运行基准测试之前就报错
+        run_scale.assert_not_called()
+
+
+class SqliteTunedBackendTests(TestCase):
+    def make_connection(self, directory, **options):
+        from django.conf import settings
+        from backend.sqlite3_tuned.base import DatabaseWrapper
+
+        settings_dict = {**connection.settings_dict, **settings.SQLITE_PRODUCTION,
+                         'NAME': os.path.join(directory, 'tuned.sqlite3')}
+        settings_dict['OPTIONS'] = {**settings_dict['OPTIONS'], **options}
+        return DatabaseWrapper(settings_dict, alias='tuned')
+
+    def test_pragmas_and_transaction_mode(self):
+        with tempfile.TemporaryDirectory() as directory:
+            tuned = self.make_connection(directory)
+            try:
+                with tuned.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertEqual(cursor.fetchone()[0], 20000)
+                    cursor.execute('PRAGMA synchronous')
+                    self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+                # IMMEDIATE事务一开始就持有写锁，其他连接无法再开始写事务
+                tuned.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+                other = sqlite3.connect(tuned.settings_dict['NAME'], timeout=0)
+                try:
+                    with self.assertRaises(sqlite3.OperationalError):
+                        other.execute('BEGIN IMMEDIATE')
+                finally:
+                    other.close()
+                tuned.rollback()
+            finally:
+                tuned.close()
+
+    def test_invalid_transaction_mode(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        with tempfile.TemporaryDirectory() as directory:
+            tuned = self.make_connection(directory, transaction_mode='LAZY')
+            with self.assertRaises(ImproperlyConfigured):
+                tuned.ensure_connection()
+
+
+@override_settings(REPLICA_DATABASE='replica')
+class ReplicaRouterTests(SimpleTestCase):
+    def test_reads_outside_replica_context_use_primary(self):
+        self.assertIsNone(ReplicaRouter().db_for_read(Order))
+
+    def test_reads_in_replica_context_until_write(self):
+        router = ReplicaRouter()
+        with use_replica():
+            self.assertEqual(router.db_for_read(Order), 'replica')
+            self.assertEqual(router.db_for_write(Order), 'default')
+            # 写入之后同一请求中的读取回到主库
+            self.assertIsNone(router.db_for_read(Order))
+        with use_replica():
+            self.assertEqual(router.db_for_read(Order), 'replica')
+
+    @override_settings(REPLICA_DATABASE=None)
+    def test_without_replica(self):
+        with use_replica():
+            self.assertIsNone(ReplicaRouter().db_for_read(Order))
+
+    def test_no_migrations_on_replica(self):
+        router = ReplicaRouter()
+        self.assertFalse(router.allow_migrate('replica', 'restaurant_app'))
+        self.assertIsNone(router.allow_migrate('default', 'restaurant_app'))
+
+
+class ReplicaAtomicTests(TestCase):
+    @override_settings(REPLICA_DATABASE='replica')
+    def test_reads_in_transaction_use_primary(self):
+        # TestCase在事务中运行，未提交的数据只有主库能读到
+        with use_replica():
+            self.assertIsNone(ReplicaRouter().db_for_read(Order))
+
+
+# 在线备份要等待源连接上的写事务结束，因此不能在TestCase的事务中运行
+class RefreshSqliteReplicaTests(TransactionTestCase):
+    def test_refresh_replica(self):
+        table, dishes = create_menu()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'replica.sqlite3')
+            call_command('refresh_sqlite_replica', '--path', path, stdout=StringIO())
+            replica = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+            try:
+                count = replica.execute(f'SELECT COUNT(*) FROM {Dish._meta.db_table}').fetchone()[0]
+                journal_mode = replica.execute('PRAGMA journal_mode').fetchone()[0]
+            finally:
+                replica.close()
+        self.assertEqual(count, len(dishes))
+        self.assertEqual(journal_mode, 'delete')
+
+
+# 异步统计接口与同步接口返回相同的数据
+class AsyncAnalyticsMixin:
+    urls = [
+        ('/api/dish/sales-rank/', '/api/async/dish/sales-rank/', {'period': 'week'}),
+        ('/api/dish-category/sales-rank/', '/api/async/dish-category/sales-rank/', {'period': 'week'}),
+        ('/api/order/total-amount-statistics/', '/api/async/order/total-amount-statistics/',
+         {'period': 'week', 'buckets': '0,50,100'}),
+    ]
+
+    def create_sales(self):
+        cache.clear()
+        table, dishes = create_menu()
+        order = Order.objects.create(table=table, number_of_people=2)
+        for dish, quantity in ((dishes[0], 1), (dishes[1], 3), (dishes[2], 2)):
+            DishDetail.objects.create(dish=dish, order=order, quantity=quantity)
+        old = DishDetail.objects.create(dish=dishes[0], order=order, quantity=5)
+        DishDetail.objects.filter(pk=old.pk).update(order_time=datetime.now() - timedelta(days=3))
+        call_command('rebuild_daily_sales', stdout=StringIO())
+
+    def assert_same_as_sync(self):
+        for sync_url, async_url, params in self.urls:
+            cache.clear()
+            expected = self.client.get(sync_url, params).json()
+            cache.clear()
+            response = self.client.get(async_url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Cache'], 'MISS')
+            self.assertEqual(response.json(), expected)
+
+
+@override_settings(ANALYTICS_PARALLEL_QUERIES=False)
+class AsyncAnalyticsTests(AsyncAnalyticsMixin, APITestCase):
+    def setUp(self):
+        self.create_sales()
+
+    def test_same_as_sync(self):
+        self.assert_same_as_sync()
+
+    def test_shares_cache_with_sync(self):
+        cache.clear()
+        self.client.get('/api/dish/sales-rank/', {'period': 'week'})
+        response = self.client.get('/api/async/dish/sales-rank/', {'period': 'week'})
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()[0], {'name': '菜品0', 'total_sales': 6})
+
+    def test_invalid_period(self):
+        response = self.client.get('/api/async/dish/sales-rank/', {'period': 'year'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'msg': '无效的时间段。'})
+        self.assertEqual(self.client.get('/api/async/order/total-amount-statistics/',
+                                         {'buckets': '100,50'}).status_code, 400)
+        self.assertEqual(self.client.post('/api/async/dish/sales-rank/').status_code, 405)
+
+
+# 并发查询在线程池中使用独立的数据库连接，只能读到已提交的数据
+class AsyncAnalyticsParallelTests(AsyncAnalyticsMixin, TransactionTestCase):
+    def test_parallel_queries(self):
+        self.create_sales()
+        self.assert_same_as_sync()
+
+    async def test_concurrent_requests(self):
+        await sync_to_async(self.create_sales)()
+        responses = await asyncio.gather(*(self.async_client.get('/api/async/dish/sales-rank/', {'period': 'week'})
+                                           for _ in range(5)))
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertEqual(responses[-1].json()[0], {'name': '菜品0', 'total_sales': 6})
+
+
+# 看板接口测试
+class DashboardTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.table, self.dishes = create_menu()
+        order = Order.objects.create(table=self.table, number_of_people=4)
+        for dish, quantity in ((self.dishes[0], 1), (self.dishes[1], 3), (self.dishes[2], 2)):
+            DishDetail.objects.create(dish=dish, order=order, quantity=quantity)
+        old = DishDetail.objects.create(dish=self.dishes[0], order=order, quantity=5)
+        DishDetail.objects.filter(pk=old.pk).update(order_time=datetime.now() - timedelta(days=3))
+        Order.objects.create(table=self.table, number_of_people=2)  # 没有菜品的订单，总价为空
+        call_command('rebuild_daily_sales', stdout=StringIO())
+
+    def test_same_as_separate_endpoints(self):
+        params = {'period': 'week', 'buckets': '0,100,200'}
+        with self.assertNumQueries(3):
+            data = self.client.get('/api/dashboard/', params).json()
+        cache.clear()
+        self.assertEqual(data['dish_sales_rank'], self.client.get('/api/dish/sales-rank/', params).json())
+        self.assertEqual(data['category_sales_trend'],
+                         self.client.get('/api/dish-category/sales-rank/', params).json())
+        self.assertEqual(data['total_amount_statistics'],
+                         self.client.get('/api/order/total-amount-statistics/', params).json())
+        self.assertEqual(data['summary'], {'revenue': '180.00', 'order_count': 2, 'covers': 6,
+                                           'average_ticket': '90.00'})
+
+    def test_sections(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/dashboard/', {'sections': 'summary,total_amount_statistics'})
+        self.assertEqual(set(response.data), {'summary', 'total_amount_statistics'})
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/dashboard/', {'period': 'day', 'sections': 'dish_sales_rank'})
+        self.assertEqual(list(response.data), ['dish_sales_rank'])
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get('/api/dashboard/', {'period': 'year'}).status_code, 400)
+        response = self.client.get('/api/dashboard/', {'sections': 'summary,weather'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'msg': '无效的统计项：weather。'})
+        self.assertEqual(self.client.get('/api/dashboard/', {'buckets': 'a'}).status_code, 400)
+
+
+# 员工批量操作测试
+class EmployeeBulkTests(APITestCase):
+    def create_employees(self, count):
+        return Employee.objects.bulk_create([
+            Employee(employee_number=f'E{i:03d}', name=f'员工{i}', gender='男', position='服务员')
+            for i in range(count)])
+
+    def upload(self, content, **data):
+        file = SimpleUploadedFile('employees.csv', content.encode('utf-8-sig'), content_type='text/csv')
+        return self.client.post('/api/employees/import/', {'file': file, **data}, format='multipart')
+
+    def test_delete_multiple(self):
+        employees = self.create_employees(3)
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/employees/delete-multiple/',
+                                        {'ids': [employees[0].id, employees[1].id, 9999]}, format='json')
+        self.assertEqual(response.data, {'status': 'success', 'deleted': 2, 'missing': [9999]})
+        self.assertEqual(list(Employee.objects.values_list('id', flat=True)), [employees[2].id])
+        response = self.client.post('/api/employees/delete-multiple/', {'ids': [9999]}, format='json')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post('/api/employees/delete-multiple/', {'ids': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_create(self):
+        data = [{'employee_number': f'N{i}', 'name': f'新员工{i}', 'gender': '女', 'position': '厨师'} for i in range(20)]
+        with self.assertNumQueries(4):  # 工号检查、SAVEPOINT、INSERT、RELEASE
+            response = self.client.post('/api/employees/bulk-create/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 20)
+        self.assertEqual(Employee.objects.count(), 20)
+
+    def test_bulk_create_validates_whole_batch(self):
+        self.create_employees(1)
+        data = [{'employee_number': 'N1', 'name': '甲', 'gender': '女', 'position': '厨师'},
+                {'employee_number': 'E000', 'name': '乙', 'gender': '女', 'position': '厨师'},
+                {'employee_number': 'N2', 'name': '丙', 'gender': '未知', 'position': '厨师'}]
+        response = self.client.post('/api/employees/bulk-create/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.data['msg']
+        self.assertEqual(errors[0], {})
+        self.assertIn('employee_number', errors[1])
+        self.assertIn('gender', errors[2])
+        self.assertEqual(Employee.objects.count(), 1)
+
+    def test_bulk_update(self):
+        employees = self.create_employees(3)
+        data = [{'id': employees[0].id, 'position': '经理'}, {'id': employees[1].id, 'is_resigned': True}]
+        response = self.client.post('/api/employees/bulk-update/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        employees = Employee.objects.in_bulk([employee.id for employee in employees])
+        self.assertEqual([(e.position, e.is_resigned) for e in employees.values()],
+                         [('经理', False), ('服务员', True), ('服务员', False)])
+
+        response = self.client.post('/api/employees/bulk-update/', [{'id': 9999, 'name': '无'}], format='json')
+        self.assertEqual(response.data['missing'], [9999])
+        ids = list(employees)
+        response = self.client.post('/api/employees/bulk-update/',
+                                    [{'id': ids[0], 'employee_number': 'E001'}], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_import_csv(self):
+        self.create_employees(1)
+        content = 'employee_number,name,gender,position\nE000,张三,男,经理\nC001,李四,女,收银员\n'
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+        self.assertEqual(Employee.objects.count(), 1)
+
+        response = self.upload(content, upsert='true')
+        self.assertEqual(response.data, {'status': 'success', 'created': 1, 'updated': 1})
+        self.assertEqual(Employee.objects.get(employee_number='E000').position, '经理')
+        self.assertEqual(Employee.objects.get(employee_number='C001').name, '李四')
+
+    def test_import_csv_invalid(self):
+        self.assertEqual(self.upload('employee_number,name\nE1,张三\n').status_code, 400)
+        response = self.upload('employee_number,name,gender,position\nE1,张三,男,厨师\nE1,李四,女,厨师\n')
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3])
+
+
+# 桌位占用状态和SSE推送测试
+@override_settings(SSE_KEEPALIVE=0.05, SSE_MAX_DURATION=5)
+class TableStatusTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.table, self.dishes = create_menu()
+        self.free_table = Table.objects.create(table_number=2)
+        self.order = Order.objects.create(table=self.table, number_of_people=4)
+        DishDetail.objects.create(dish=self.dishes[1], order=self.order, quantity=2)
+
+    def test_status(self):
+        Order.objects.create(table=self.table, number_of_people=2, transaction_status='已结账')
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/table/status/').json()
+        self.assertEqual([(row['table_number'], row['occupied'], row['party_size'], row['open_total'])
+                          for row in data], [(1, True, 4, '40.00'), (2, False, 0, '0.00')])
+        self.assertEqual(data[0]['seated_minutes'], 0)
+        self.assertIsNone(data[1]['seated_at'])
+
+    def test_stream(self):
+        response = self.client.get('/api/table/status/stream/', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        stream = iter(response.streaming_content)
+        self.assertTrue(next(stream).startswith(b'retry:'))
+        snapshot = next(stream).decode()
+        self.assertTrue(snapshot.startswith('event: snapshot\n'))
+        self.assertEqual(len(json.loads(snapshot.split('data: ', 1)[1])), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(table=self.free_table, number_of_people=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            DishDetail.objects.create(dish=self.dishes[0], order=self.order, quantity=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.refresh_from_db()
+            self.order.save()  # 状态没有变化，不推送
+        events = [next(stream).decode() for _ in range(2)]
+        self.assertEqual([json.loads(event.split('data: ', 1)[1])['table_number'] for event in events], [2, 1])
+        self.assertEqual(json.loads(events[1].split('data: ', 1)[1])['open_total'], '50.00')
+        self.assertEqual(next(stream), b': keepalive\n\n')
+        response.close()
+
+    def test_order_table_change(self):
+        # 保存订单不需要查询原来的桌位
+        with CaptureQueriesContext(connection) as captured:
+            self.order.save()
+        self.assertFalse([query for query in captured if query['sql'].startswith('SELECT')])
+
+        order = Order.objects.get(pk=self.order.pk)
+        with mock.patch('restaurant_app.models.schedule_table_status') as schedule:
+            order.table = self.free_table
+            order.save()
+            order.save()
+        self.assertEqual(schedule.call_args_list, [mock.call(table_id=self.free_table.id),
+                                                   mock.call(table_id=self.table.id),
+                                                   mock.call(table_id=self.free_table.id)])
+
+    def test_benchmark_skips_streams(self):
+        # SSE接口的响应不会立即结束，基准测试命令不应该请求
+        urls = [url for _, url, _, _ in get_endpoints()]
+        self.assertIn('/api/table/status/', urls)
+        self.assertFalse([url for url in urls if url.endswith('/stream/')])
+
+    async def test_async_stream(self):
+        response = await self.async_client.get('/api/table/status/stream/', ACCEPT='text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+        self.assertTrue((await anext(stream)).startswith(b'event: snapshot\n'))
+        self.assertEqual(await anext(stream), b': keepalive\n\n')
+        await stream.aclose()
+
+
+# 后厨单长轮询和SSE推送测试
+@override_settings(SSE_KEEPALIVE=0.05, SSE_MAX_DURATION=5)
+class KitchenTicketTests(APITestCase):
+    def setUp(self):
+        self.table, self.dishes = create_menu()
+        self.order = Order.objects.create(table=self.table, number_of_people=2)
+        self.lines = [DishDetail.objects.create(dish=dish, order=self.order, quantity=i + 1)
+                      for i, dish in enumerate(self.dishes)]
+
+    def test_long_poll(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/dish-detail/tickets/', {'after': self.lines[0].id, 'timeout': 0})
+        self.assertEqual(response.data['cursor'], self.lines[2].id)
+        self.assertEqual(response.data['tickets'][0], {
+            'id': self.lines[1].id, 'order_id': self.order.id, 'quantity': 2, 'name': '菜品1', 'unit': '份',
+            'specification': '精品', 'table_number': 1, 'order_time': self.lines[1].order_time,
+        })
+        self.assertEqual(len(response.data['tickets']), 2)
+
+        # 没有游标时从最新的菜品详情开始
+        response = self.client.get('/api/dish-detail/tickets/', {'timeout': 0})
+        self.assertEqual(response.data, {'cursor': self.lines[2].id, 'tickets': []})
+        self.assertEqual(self.client.get('/api/dish-detail/tickets/', {'after': 'x'}).status_code, 400)
+
+    def test_stream_resumes(self):
+        response = self.client.get('/api/dish-detail/tickets/stream/', {'after': self.lines[1].id},
+                                   HTTP_ACCEPT='text/event-stream')
+        stream = iter(response.streaming_content)
+        self.assertTrue(next(stream).startswith(b'retry:'))
+        self.assertTrue(next(stream).decode().startswith(f'id: {self.lines[2].id}\nevent: ticket\n'))
+
+        # 一次提交的订单（bulk_create）也会唤醒推送
+        payload = {'table': self.table.id, 'number_of_people': 3,
+                   'dishes': [{'dish': self.dishes[0].id, 'quantity': 2}, {'dish': self.dishes[2].id, 'quantity': 1}]}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/order/submit/', payload, format='json')
+        events = [json.loads(next(stream).decode().split('data: ', 1)[1]) for _ in range(2)]
+        self.assertEqual([(event['name'], event['quantity']) for event in events], [('菜品0', 2), ('菜品2', 1)])
+        self.assertEqual(next(stream), b': keepalive\n\n')
+        response.close()
+
+        # 重连时Last-Event-ID优先于after参数
+        response = self.client.get('/api/dish-detail/tickets/stream/', {'after': 0},
+                                   HTTP_LAST_EVENT_ID=str(events[0]['id']))
+        stream = iter(response.streaming_content)
+        next(stream)
+        self.assertEqual(json.loads(next(stream).decode().split('data: ', 1)[1])['id'], events[1]['id'])
+        response.close()
+
+    @mock.patch('restaurant_app.kitchen.TICKET_BATCH_SIZE', 2)
+    def test_stream_reads_one_batch_at_a_time(self):
+        response = self.client.get('/api/dish-detail/tickets/stream/', {'after': 0})
+        stream = iter(response.streaming_content)
+        next(stream)
+        # 每批一条 id > 游标 的查询，取完一批才查询下一批
+        with self.assertNumQueries(1):
+            next(stream)
+        with self.assertNumQueries(0):
+            next(stream)
+        with self.assertNumQueries(1):
+            self.assertIn(f'id: {self.lines[2].id}\n'.encode(), next(stream))
+        response.close()
+
+    @mock.patch('restaurant_app.kitchen.TICKET_BATCH_SIZE', 2)
+    async def test_async_stream(self):
+        response = await self.async_client.get('/api/dish-detail/tickets/stream/', {'after': 0})
+        stream = aiter(response.streaming_content)
+        await anext(stream)
+        ids = [int((await anext(stream)).split(b'\n', 1)[0][4:]) for _ in range(3)]
+        self.assertEqual(ids, [line.id for line in self.lines])
+        self.assertEqual(await anext(stream), b': keepalive\n\n')
+        await stream.aclose()
+
+    def test_benchmark_params(self):
+        endpoints = {url: params for _, url, params, _ in get_endpoints()}
+        self.assertEqual(endpoints['/api/dish-detail/tickets/'], {'timeout': 0})
+        self.assertNotIn('/api/dish-detail/tickets/stream/', endpoints)
+
+
+# 订单热力图测试
+class OrderHeatmapTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.table, self.dishes = create_menu()
+        self.other_category = DishCategory.objects.create(category='凉菜')
+        Dish.objects.filter(pk=self.dishes[2].pk).update(category=self.other_category)
+        monday = get_calendar_range('last_week')[0]
+        for when, people, quantities in ((monday + timedelta(hours=12, minutes=5), 2, (1, 0, 1)),
+                                         (monday + timedelta(hours=12, minutes=50), 4, (0, 2, 0)),
+                                         (monday + timedelta(days=6, hours=19), 3, (0, 0, 2)),
+                                         (monday - timedelta(minutes=1), 5, (1, 0, 0))):  # 上上周，不统计
+            order = Order.objects.create(table=self.table, number_of_people=people)
+            for dish, quantity in zip(self.dishes, quantities):
+                if quantity:
+                    DishDetail.objects.create(dish=dish, order=order, quantity=quantity)
+            Order.objects.filter(pk=order.pk).update(transaction_time=when)
+
+    def test_calendar_range(self):
+        now = datetime(2024, 3, 13, 15, 30)  # 星期三
+        self.assertEqual(get_calendar_range('day', now), (datetime(2024, 3, 13), datetime(2024, 3, 14)))
+        self.assertEqual(get_calendar_range('week', now), (datetime(2024, 3, 11), datetime(2024, 3, 18)))
+        self.assertEqual(get_calendar_range('last_week', now), (datetime(2024, 3, 4), datetime(2024, 3, 11)))
+        self.assertEqual(get_calendar_range('month', now), (datetime(2024, 3, 1), datetime(2024, 4, 1)))
+        self.assertEqual(get_calendar_range('last_month', now), (datetime(2024, 2, 1), datetime(2024, 3, 1)))
+        with self.assertRaises(ValueError):
+            get_calendar_range('year', now)
+
+    def test_heatmap(self):
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/order/heatmap/', {'period': 'last_week'}).json()
+        self.assertEqual(len(data['orders']), 7)
+        self.assertEqual({len(row) for row in data['orders']}, {24})
+        self.assertEqual((data['orders'][0][12], data['covers'][0][12], data['revenue'][0][12]), (2, 6, '80.00'))
+        self.assertEqual((data['orders'][6][19], data['covers'][6][19], data['revenue'][6][19]), (1, 3, '60.00'))
+        self.assertEqual(sum(map(sum, data['orders'])), 3)
+        self.assertEqual(data['revenue'][1][12], '0.00')
+
+    def test_heatmap_by_category(self):
+        data = self.client.get('/api/order/heatmap/', {'period': 'last_week',
+                                                       'category': self.other_category.pk}).json()
+        # 只统计包含凉菜的订单，营业额只计凉菜
+        self.assertEqual((data['orders'][0][12], data['covers'][0][12], data['revenue'][0][12]), (1, 2, '30.00'))
+        self.assertEqual(data['revenue'][6][19], '60.00')
+        self.assertEqual(sum(map(sum, data['orders'])), 2)
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get('/api/order/heatmap/', {'period': 'year'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/order/heatmap/', {'category': 'x'}).status_code, 400)
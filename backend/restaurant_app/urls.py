@@ -2,7 +2,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import TableViewSet, DishCategoryViewSet, DishUnitViewSet, DishImageViewSet, DishViewSet, OrderViewSet, \
-    DishDetailViewSet, EmployeeViewSet
+    DishDetailViewSet, EmployeeViewSet, AnalyticsCacheViewSet, DashboardViewSet
+from . import async_views
 
 # Creating a DefaultRouter to handle the viewset's URL routing
 router = DefaultRouter()
@@ -14,9 +15,16 @@ router.register(r'dish', DishViewSet)
 router.register(r'order', OrderViewSet)
 router.register(r'dish-detail', DishDetailViewSet)
 router.register(r'employees', EmployeeViewSet)
+router.register(r'analytics-cache', AnalyticsCacheViewSet, basename='analytics-cache')
+router.register(r'dashboard', DashboardViewSet, basename='dashboard')
 
 # Defining the URL patterns for the app
 urlpatterns = [
     # Including the URLs generated by the router
     path('', include(router.urls)),
+    # 统计接口的异步版本，在ASGI下运行时不占用工作线程
+    path('async/dish/sales-rank/', async_views.dish_sales_rank, name='async-dish-sales-rank'),
+    path('async/dish-category/sales-rank/', async_views.category_sales_rank, name='async-dish-category-sales-rank'),
+    path('async/order/total-amount-statistics/', async_views.total_amount_statistics,
+         name='async-order-total-amount-statistics'),
 ]
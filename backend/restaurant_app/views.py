@@ -1,16 +1,41 @@
 # views.py
-from rest_framework import viewsets
+from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from django.shortcuts import get_list_or_404
-from django.db.models import Sum, F
-from datetime import datetime, timedelta
-from collections import defaultdict
-
-from .models import Table, DishCategory, DishUnit, DishImage, Dish, Order, DishDetail, Employee
+from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.renderers import JSONRenderer
+from django.http import StreamingHttpResponse
+from django.db import transaction
+from django.conf import settings
+from django.db.models import Sum, Prefetch, Q, Count, Case, When, Value, IntegerField, Exists, OuterRef, Subquery
+from django.db.models.functions import TruncDate, ExtractHour, ExtractIsoWeekDay
+from datetime import datetime, timedelta, time
+from collections import defaultdict, Counter
+from decimal import Decimal, InvalidOperation
+from io import TextIOWrapper
+import csv
+
+from .images import schedule_variants
+from .export import stream_csv, stream_ndjson
+from .cache import cached_analytics, get_cache_stats, ConditionalListMixin
+from .db_routers import read_from_replica, ReplicaListMixin
+from .events import EventStreamRenderer, event_stream_response, format_sse
+from .kitchen import kitchen_channel, get_latest_ticket_id, wait_for_tickets, ticket_messages
+from .table_status import get_table_status, table_status_channel
+from .pagination import OptionalCursorPaginationMixin, OrderCursorPagination, DishDetailCursorPagination
+from .models import Table, DishCategory, DishUnit, DishImage, Dish, Order, DishDetail, Employee, DailyDishSales
 from .serializers import TableSerializer, DishCategorySerializer, DishUnitSerializer, DishImageSerializer, \
-    DishSerializer, OrderSerializer, DishDetailSerializer, EmployeeSerializer
+    DishSerializer, OrderSerializer, DishDetailSerializer, EmployeeSerializer, OrderSubmitSerializer, \
+    EmployeeBulkSerializer
+
+# 订单总价区间的默认边界，最后一个区间没有上限
+DEFAULT_TOTAL_AMOUNT_BUCKETS = [0, 200, 400, 600, 800, 1000, 1200, 1400, 1600, 1800, 2000]
+MAX_TOTAL_AMOUNT_BUCKETS = 100
+# 看板接口可以返回的统计项
+DASHBOARD_SECTIONS = ['dish_sales_rank', 'category_sales_trend', 'total_amount_statistics', 'summary']
+# 导入员工CSV文件必须包含的列
+EMPLOYEE_IMPORT_COLUMNS = ['employee_number', 'name', 'gender', 'position']
 
 
 def get_time_range(period):
@@ -29,34 +54,339 @@ def get_time_range(period):
     return start_time, now
 
 
-def get_total_amount_statistics(queryset):
+def split_time_range(start_time, end_time):
     """
-    根据给定的订单查询集，返回一个字典，其中包含各个订单总价区间的数量。
+    将时间范围拆分为菜品每日销量汇总表可以覆盖的完整日期区间[first_day, last_day)，以及需要从DishDetail原始数据
+    统计的首尾不完整时间段的过滤条件。没有完整日期时返回的日期区间为None。
+    """
+    first_day = start_time.date() if start_time.time() == time.min else start_time.date() + timedelta(days=1)
+    last_day = end_time.date()  # 结束时间所在的当天数据仍在变化，从原始数据统计
+    if first_day >= last_day:
+        return None, Q(order_time__range=(start_time, end_time))
+    raw_filter = Q(order_time__gte=start_time, order_time__lt=datetime.combine(first_day, time.min)) | \
+        Q(order_time__gte=datetime.combine(last_day, time.min), order_time__lte=end_time)
+    return (first_day, last_day), raw_filter
+
+
+def get_dish_sales_querysets(start_time, end_time):
+    """
+    返回统计时间范围内各菜品销量所需的查询，每个查询返回(菜品名称, 销量)，完整日期的数据来自菜品每日销量汇总表。
+    这些查询互相独立，可以并发执行。
+    """
+    days, raw_filter = split_time_range(start_time, end_time)
+    querysets = [DishDetail.objects.filter(raw_filter, dish__isnull=False).values('dish__name').annotate(total_sales=Sum('quantity'))
+                 .values_list('dish__name', 'total_sales')]
+    if days is not None:
+        querysets.append(DailyDishSales.objects.filter(date__gte=days[0], date__lt=days[1])
+                         .values('dish__name').annotate(total_sales=Sum('quantity'))
+                         .values_list('dish__name', 'total_sales'))
+    return querysets
+
+
+def merge_dish_sales_rank(results):
+    """
+    合并get_dish_sales_querysets各查询的结果，返回按销量从高到低排列的菜品销量排行。
+    """
+    totals = Counter()
+    for rows in results:
+        for name, total_sales in rows:
+            totals[name] += total_sales
+    return [{'name': name, 'total_sales': total_sales}
+            for name, total_sales in sorted(totals.items(), key=lambda item: -item[1]) if total_sales]
+
+
+def get_dish_sales_rank(start_time, end_time):
+    """
+    返回时间范围内各菜品的销量排行，完整日期的数据来自菜品每日销量汇总表。
+    """
+    return merge_dish_sales_rank(get_dish_sales_querysets(start_time, end_time))
+
+
+def get_category_sales_querysets(start_time, end_time):
+    """
+    返回统计时间范围内每天各菜品分类销量所需的查询，每个查询返回(日期, 分类名称, 销量)，可以并发执行。
+    """
+    days, raw_filter = split_time_range(start_time, end_time)
+    querysets = [DishDetail.objects.filter(raw_filter, dish__isnull=False).annotate(date=TruncDate('order_time'))
+                 .values('date', 'dish__category__category').annotate(total_sales=Sum('quantity'))
+                 .values_list('date', 'dish__category__category', 'total_sales')]
+    if days is not None:
+        querysets.append(DailyDishSales.objects.filter(date__gte=days[0], date__lt=days[1])
+                         .values('date', 'category__category').annotate(total_sales=Sum('quantity'))
+                         .values_list('date', 'category__category', 'total_sales'))
+    return querysets
+
+
+def merge_category_sales_trend(results):
+    """
+    合并get_category_sales_querysets各查询的结果，返回每个分类按日期排列的销量。
+    """
+    totals = Counter()
+    for rows in results:
+        for date, category, total_sales in rows:
+            totals[date, category] += total_sales
+
+    # 按日期和销量排序后，生成所需的数据结构
+    result_dict = defaultdict(list)
+    for (date, category), total_sales in sorted(totals.items(), key=lambda item: (item[0][0], -item[1])):
+        if total_sales:
+            result_dict[category].append({
+                'date': date,
+                'total_sales': total_sales
+            })
+    return [{'category': category, 'data': data} for category, data in result_dict.items()]
+
+
+def get_category_sales_trend(start_time, end_time):
+    """
+    返回时间范围内每天各菜品分类的销量，完整日期的数据来自菜品每日销量汇总表。
     """
-    ranges = [(0, 200), (200, 400), (400, 600), (600, 800), (800, 1000), (1000, 1200), (1200, 1400), (1400, 1600),
-              (1600, 1800), (1800, 2000), (2000, float('inf'))]
-    statistics = {f'{start}-{end if end != float("inf") else "inf"}': 0 for start, end in ranges}
-    for order in queryset:
-        for start, end in ranges:
-            if start <= order.total_amount < end:
-                statistics[f'{start}-{end if end != float("inf") else "inf"}'] += 1
-                break
+    return merge_category_sales_trend(get_category_sales_querysets(start_time, end_time))
+
+
+def get_dish_detail_prefetch():
+    """
+    返回订单菜品详情的Prefetch对象，一条查询取出全部菜品详情，菜品名称、单位和规格直接读取快照字段，避免序列化时逐行查询。
+    """
+    return Prefetch('dishdetail_set', queryset=DishDetail.objects.order_by('id'))
+
+
+def get_total_amount_buckets(value=None):
+    """
+    解析订单总价区间的边界，如'0,100,500'，返回升序的Decimal列表，最后一个区间没有上限。
+    未提供时使用settings.TOTAL_AMOUNT_BUCKETS。
+    """
+    edges = value.split(',') if value else getattr(settings, 'TOTAL_AMOUNT_BUCKETS', DEFAULT_TOTAL_AMOUNT_BUCKETS)
+    try:
+        edges = [Decimal(str(edge).strip()) for edge in edges]
+    except InvalidOperation:
+        raise ValueError('无效的总价区间。')
+    if not edges or len(edges) > MAX_TOTAL_AMOUNT_BUCKETS or not all(edge.is_finite() for edge in edges) \
+            or any(start >= end for start, end in zip(edges, edges[1:])):
+        raise ValueError('无效的总价区间。')
+    return edges
+
+
+def get_total_amount_labels(edges):
+    ranges = list(zip(edges, edges[1:] + [None]))
+    return [f'{start:f}-{end:f}' if end is not None else f'{start:f}-inf' for start, end in ranges]
+
+
+def get_total_amount_bucket(edges, below=None):
+    """
+    返回计算订单总价所在区间序号的Case表达式；指定below时，总价为空或小于第一个边界的订单的序号为below。
+    """
+    ranges = list(zip(edges, edges[1:] + [None]))
+    whens = [When(total_amount__lt=end, then=Value(index)) for index, (start, end) in enumerate(ranges[:-1])]
+    if below is not None:
+        whens = [When(total_amount__isnull=True, then=Value(below)),
+                 When(total_amount__lt=edges[0], then=Value(below))] + whens
+    return Case(*whens, default=Value(len(ranges) - 1), output_field=IntegerField())
+
+
+def get_total_amount_queryset(queryset, edges):
+    """
+    返回按订单总价区间分组计数的查询，每行为(区间序号, 订单数量)，总价为空的订单不参与统计。
+    """
+    return queryset.filter(total_amount__gte=edges[0]).order_by() \
+        .annotate(bucket=get_total_amount_bucket(edges)).values('bucket').annotate(count=Count('id')) \
+        .values_list('bucket', 'count')
+
+
+def merge_total_amount_statistics(rows, edges):
+    labels = get_total_amount_labels(edges)
+    statistics = dict.fromkeys(labels, 0)
+    for bucket, count in rows:
+        statistics[labels[bucket]] = count
     return statistics
 
 
+def format_total_amount_statistics(statistics):
+    return [{'ranges': ranges, 'statistics': stat} for ranges, stat in statistics.items()]
+
+
+def get_total_amount_statistics(queryset, edges=None):
+    """
+    根据给定的订单查询集，返回一个字典，其中包含各个订单总价区间的数量。
+    区间划分在数据库中通过一条分组聚合查询完成，总价为空的订单不参与统计。
+    """
+    edges = edges or get_total_amount_buckets()
+    return merge_total_amount_statistics(get_total_amount_queryset(queryset, edges), edges)
+
+
+def get_dish_daily_sales_querysets(start_time, end_time):
+    """
+    返回时间范围内每天各菜品销量所需的查询，每行为(日期, 菜品名称, 分类名称, 销量)。
+    菜品销量排行和菜品分类销售趋势都可以由这些查询的结果合并得到，不必分别扫描一遍菜品详情。
+    """
+    days, raw_filter = split_time_range(start_time, end_time)
+    querysets = [DishDetail.objects.filter(raw_filter, dish__isnull=False).annotate(date=TruncDate('order_time'))
+                 .values('date', 'dish__name', 'dish__category__category').annotate(total_sales=Sum('quantity'))
+                 .values_list('date', 'dish__name', 'dish__category__category', 'total_sales')]
+    if days is not None:
+        querysets.append(DailyDishSales.objects.filter(date__gte=days[0], date__lt=days[1])
+                         .values('date', 'dish__name', 'category__category').annotate(total_sales=Sum('quantity'))
+                         .values_list('date', 'dish__name', 'category__category', 'total_sales'))
+    return querysets
+
+
+def get_order_summary_queryset(queryset, edges):
+    """
+    返回按订单总价区间分组的查询，每行为(区间序号, 订单数量, 营业额, 就餐人数)，
+    总价为空或小于第一个边界的订单的区间序号为-1，只计入营业额等汇总数据。
+    """
+    return queryset.order_by().annotate(bucket=get_total_amount_bucket(edges, below=-1)).values('bucket') \
+        .annotate(count=Count('id'), revenue=Sum('total_amount'), covers=Sum('number_of_people')) \
+        .values_list('bucket', 'count', 'revenue', 'covers')
+
+
+def merge_order_summary(rows):
+    """
+    合并get_order_summary_queryset的结果，返回营业额、订单数、就餐人数和客单价。
+    """
+    revenue, order_count, covers = Decimal('0.00'), 0, 0
+    for bucket, count, bucket_revenue, bucket_covers in rows:
+        revenue += bucket_revenue or 0
+        order_count += count
+        covers += bucket_covers or 0
+    average_ticket = revenue / order_count if order_count else Decimal('0.00')
+    return {
+        'revenue': f'{revenue:.2f}',
+        'order_count': order_count,
+        'covers': covers,
+        'average_ticket': f'{average_ticket:.2f}',
+    }
+
+
+def get_dashboard(period, sections, edges=None):
+    """
+    返回看板需要的各项统计。菜品相关的统计共用一次对菜品详情（和每日销量汇总表）的分组查询，
+    订单相关的统计共用一次对订单的分组查询，只查询sections中需要的部分。
+    """
+    start_time, end_time = get_time_range(period)
+    result = {}
+    if {'dish_sales_rank', 'category_sales_trend'} & set(sections):
+        results = [list(queryset) for queryset in get_dish_daily_sales_querysets(start_time, end_time)]
+        if 'dish_sales_rank' in sections:
+            result['dish_sales_rank'] = merge_dish_sales_rank(
+                [(name, total_sales) for date, name, category, total_sales in rows] for rows in results)
+        if 'category_sales_trend' in sections:
+            result['category_sales_trend'] = merge_category_sales_trend(
+                [(date, category, total_sales) for date, name, category, total_sales in rows] for rows in results)
+    if {'total_amount_statistics', 'summary'} & set(sections):
+        edges = edges or get_total_amount_buckets()
+        queryset = Order.objects.filter(transaction_time__range=(start_time, end_time))
+        rows = list(get_order_summary_queryset(queryset, edges))
+        if 'total_amount_statistics' in sections:
+            statistics = merge_total_amount_statistics([(bucket, count) for bucket, count, *_ in rows if bucket >= 0],
+                                                       edges)
+            result['total_amount_statistics'] = format_total_amount_statistics(statistics)
+        if 'summary' in sections:
+            result['summary'] = merge_order_summary(rows)
+    return result
+
+
+HEATMAP_WEEKDAYS = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
+
+
+def get_calendar_range(period, now=None):
+    """
+    根据给定的时间段返回按日历对齐的时间范围[start, end)：'day'为今天，'week'为本周一到周日，'month'为本月，
+    'last_week'和'last_month'为上一个完整的周和月。与get_time_range的滚动时间窗口不同，同一时间段内的请求范围相同。
+    """
+    today = (now or datetime.now()).date()
+    if period == 'day':
+        start = today
+        end = start + timedelta(days=1)
+    elif period in ('week', 'last_week'):
+        start = today - timedelta(days=today.weekday())
+        if period == 'last_week':
+            start -= timedelta(weeks=1)
+        end = start + timedelta(weeks=1)
+    elif period in ('month', 'last_month'):
+        start = today.replace(day=1)
+        if period == 'last_month':
+            start = (start - timedelta(days=1)).replace(day=1)
+        end = (start + timedelta(days=31)).replace(day=1)
+    else:
+        raise ValueError('无效的时间段。')
+    return datetime.combine(start, time.min), datetime.combine(end, time.min)
+
+
+def get_heatmap_queryset(start_time, end_time, category_id=None):
+    """
+    返回按星期几和小时分组的订单查询，每行为(星期几, 小时, 订单数量, 就餐人数, 营业额)，星期一为1。
+    指定菜品分类时只统计包含该分类菜品的订单，营业额为这些订单中该分类菜品的总价。
+    分组和聚合在数据库中用一条查询完成。
+    """
+    queryset = Order.objects.filter(transaction_time__gte=start_time, transaction_time__lt=end_time)
+    revenue = 'total_amount'
+    if category_id is not None:
+        lines = DishDetail.objects.filter(order=OuterRef('pk'), dish__category_id=category_id)
+        queryset = queryset.filter(Exists(lines)).annotate(category_revenue=Subquery(
+            lines.order_by().values('order').annotate(revenue=Sum('total_price')).values('revenue')))
+        revenue = 'category_revenue'
+    return queryset.order_by() \
+        .annotate(weekday=ExtractIsoWeekDay('transaction_time'), hour=ExtractHour('transaction_time')) \
+        .values('weekday', 'hour') \
+        .annotate(orders=Count('id'), covers=Sum('number_of_people'), revenue=Sum(revenue)) \
+        .values_list('weekday', 'hour', 'orders', 'covers', 'revenue')
+
+
+def merge_heatmap(rows):
+    """
+    把get_heatmap_queryset的分组结果填入7×24的矩阵，行为周一到周日，列为0到23点，没有订单的格子为0。
+    """
+    orders = [[0] * 24 for _ in HEATMAP_WEEKDAYS]
+    covers = [[0] * 24 for _ in HEATMAP_WEEKDAYS]
+    revenue = [[Decimal('0.00')] * 24 for _ in HEATMAP_WEEKDAYS]
+    for weekday, hour, order_count, cover_count, amount in rows:
+        orders[weekday - 1][hour] = order_count
+        covers[weekday - 1][hour] = cover_count or 0
+        revenue[weekday - 1][hour] = amount or Decimal('0.00')
+    return {
+        'weekdays': HEATMAP_WEEKDAYS,
+        'hours': list(range(24)),
+        'orders': orders,
+        'covers': covers,
+        'revenue': [[f'{amount:.2f}' for amount in row] for row in revenue],
+    }
+
+
 # 桌位表视图
-class TableViewSet(viewsets.ModelViewSet):
+class TableViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     queryset = Table.objects.all().order_by('table_number')
     serializer_class = TableSerializer
     pagination_class = None  # 不分页
+    etag_models = (Table,)  # 列表接口支持ETag条件请求
     # permission_classes = [IsAuthenticated]
 
+    # 桌位占用状态：返回每张桌子是否有未结账的订单、用餐人数、未结账金额、入座时间和已入座的分钟数。
+    #
+    # 示例：GET /table/status/
+    @action(detail=False, methods=['get'], url_path='status')
+    def table_status(self, request, *args, **kwargs):
+        return Response(get_table_status())
+
+    # 桌位占用状态推送（SSE）：连接后先发送一条snapshot事件包含全部桌位的状态，之后某张桌子的状态变化时
+    # 发送一条table事件，代替定时轮询/table/status/。浏览器中使用new EventSource('/api/table/status/stream/')。
+    #
+    # 示例：GET /table/status/stream/
+    @action(detail=False, methods=['get'], url_path='status/stream', renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def status_stream(self, request, *args, **kwargs):
+        return event_stream_response(
+            request, table_status_channel,
+            snapshot=lambda: [format_sse(get_table_status(), event='snapshot')],
+            changes=lambda status: [format_sse(status, event='table')],
+        )
+
 
 # 菜品分类表视图
-class DishCategoryViewSet(viewsets.ModelViewSet):
+class DishCategoryViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     queryset = DishCategory.objects.all().order_by('id')
     serializer_class = DishCategorySerializer
     pagination_class = None  # 不分页
+    etag_models = (DishCategory,)  # 列表接口支持ETag条件请求
 
     # permission_classes = [IsAuthenticated]
 
@@ -66,41 +396,22 @@ class DishCategoryViewSet(viewsets.ModelViewSet):
     #
     # 示例：GET /dish-category/sales-rank/?period=month
     @action(detail=False, methods=['get'], url_path='sales-rank')
+    @cached_analytics('dish-category-sales-rank')
+    @read_from_replica
     def sales_rank(self, request, *args, **kwargs):
         period = request.query_params.get('period', 'week')  # 默认为'week'
         if period not in ['week', 'month']:
             return Response({'msg': '无效的时间段。'}, status=400)
 
-        start_date, end_date = get_time_range(period)
-        queryset = DishDetail.objects.filter(order_time__range=(start_date, end_date)) \
-            .extra({"date": "date(order_time)"}) \
-            .values('date', 'dish__category__category') \
-            .annotate(total_sales=Sum('quantity')) \
-            .order_by('date', '-total_sales')
-
-        # 对查询结果进行后处理，生成所需的数据结构
-        result_dict = defaultdict(list)
-        for item in queryset:
-            result_dict[item['dish__category__category']].append({
-                'date': item['date'],
-                'total_sales': item['total_sales']
-            })
-
-        result = []
-        for category, data in result_dict.items():
-            result.append({
-                'category': category,
-                'data': data
-            })
-
-        return Response(result)
+        return Response(get_category_sales_trend(*get_time_range(period)))
 
 
 # 菜品单位表视图
-class DishUnitViewSet(viewsets.ModelViewSet):
+class DishUnitViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     queryset = DishUnit.objects.all().order_by('id')
     serializer_class = DishUnitSerializer
     pagination_class = None  # 不分页
+    etag_models = (DishUnit,)  # 列表接口支持ETag条件请求
     # permission_classes = [IsAuthenticated]
 
 
@@ -109,11 +420,23 @@ class DishImageViewSet(viewsets.ModelViewSet):
     serializer_class = DishImageSerializer
     # permission_classes = [IsAuthenticated]
 
+    # 上传或更换图片后，在事务提交后交给线程池生成多尺寸版本
+    def perform_create(self, serializer):
+        image = serializer.save()
+        transaction.on_commit(lambda: schedule_variants(image.pk))
+
+    def perform_update(self, serializer):
+        file_changed = 'file' in serializer.validated_data
+        image = serializer.save()
+        if file_changed:
+            transaction.on_commit(lambda: schedule_variants(image.pk))
+
 
 # 菜品表视图
-class DishViewSet(viewsets.ModelViewSet):
-    queryset = Dish.objects.all().order_by('-id')
+class DishViewSet(ConditionalListMixin, viewsets.ModelViewSet):
+    queryset = Dish.objects.select_related('category', 'unit', 'file').order_by('-id')
     serializer_class = DishSerializer
+    etag_models = (Dish, DishCategory, DishUnit, DishImage)  # 菜单依赖的所有模型，任何一个变化ETag都会变化
 
     # permission_classes = [IsAuthenticated]
 
@@ -123,20 +446,20 @@ class DishViewSet(viewsets.ModelViewSet):
     #
     # 示例：GET /dish/sales-rank/?period=day
     @action(detail=False, methods=['get'], url_path='sales-rank')
+    @cached_analytics('dish-sales-rank')
+    @read_from_replica
     def sales_rank(self, request, *args, **kwargs):
         period = request.query_params.get('period', 'day')  # 默认为'day'
         if period not in ['day', 'week', 'month']:
             return Response({'msg': '无效的时间段。'}, status=400)
-        queryset = DishDetail.objects.filter(order_time__range=get_time_range(period)) \
-            .values('dish__name').annotate(name=F('dish__name'), total_sales=Sum('quantity')) \
-            .values('name', 'total_sales').order_by('-total_sales')
-        return Response(queryset)
+        return Response(get_dish_sales_rank(*get_time_range(period)))
 
 
 # 订单表视图
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all().order_by('-transaction_time')
+class OrderViewSet(ReplicaListMixin, OptionalCursorPaginationMixin, viewsets.ModelViewSet):
+    queryset = Order.objects.prefetch_related(get_dish_detail_prefetch()).order_by('-transaction_time')
     serializer_class = OrderSerializer
+    cursor_pagination_class = OrderCursorPagination  # ?pagination=cursor时使用游标分页
 
     # permission_classes = [IsAuthenticated]
 
@@ -161,24 +484,77 @@ class OrderViewSet(viewsets.ModelViewSet):
     # 进行展示统计数据。可以通过发送一个GET请求到/orders/total-amount-statistics来使用这个接口。
     # 在请求的查询参数中，可以提供一个名为period的参数，其值可以是’day’，‘week’或’month’。
     #
+    # 可以通过buckets参数自定义区间边界，以逗号分隔，最后一个区间没有上限，默认使用settings.TOTAL_AMOUNT_BUCKETS。
+    #
     # 示例：GET /order/total-amount-statistics/?period=week
+    # 示例：GET /order/total-amount-statistics/?period=month&buckets=0,100,300,1000
     @action(detail=False, methods=['get'], url_path='total-amount-statistics')
+    @cached_analytics('order-total-amount-statistics')
+    @read_from_replica
     def total_amount_statistics(self, request, *args, **kwargs):
         period = request.query_params.get('period', 'day')  # 默认为'day'
         if period not in ['day', 'week', 'month']:
             return Response({'msg': '无效的时间段。'}, status=400)
+        try:
+            edges = get_total_amount_buckets(request.query_params.get('buckets'))
+        except ValueError as exc:
+            return Response({'msg': str(exc)}, status=400)
         queryset = Order.objects.filter(transaction_time__range=get_time_range(period))
-        statistics = get_total_amount_statistics(queryset)
-
-        # 对statistics进行处理，生成所需的数据结构
-        result = []
-        for ranges, stat in statistics.items():
-            result.append({
-                'ranges': ranges,
-                'statistics': stat
-            })
+        statistics = get_total_amount_statistics(queryset, edges)
+        return Response(format_total_amount_statistics(statistics))
 
-        return Response(result)
+    # 订单热力图：按星期几和小时统计订单数量、就餐人数和营业额，返回7×24的矩阵，用于安排排班。
+    # period可以是'day'，'week'（本周一到周日，默认），'month'（本月），'last_week'或'last_month'，按日历对齐；
+    # 可以通过category参数指定菜品分类的id，只统计包含该分类菜品的订单，营业额为该分类菜品的总价。
+    #
+    # 示例：GET /order/heatmap/?period=last_month
+    # 示例：GET /order/heatmap/?period=week&category=2
+    @action(detail=False, methods=['get'], url_path='heatmap')
+    @cached_analytics('order-heatmap')
+    @read_from_replica
+    def heatmap(self, request, *args, **kwargs):
+        period = request.query_params.get('period', 'week')  # 默认为'week'
+        try:
+            start_time, end_time = get_calendar_range(period)
+        except ValueError as exc:
+            return Response({'msg': str(exc)}, status=400)
+        category_id = request.query_params.get('category')
+        if category_id is not None:
+            try:
+                category_id = int(category_id)
+            except ValueError:
+                return Response({'msg': '无效的菜品分类。'}, status=400)
+        heatmap = merge_heatmap(get_heatmap_queryset(start_time, end_time, category_id))
+        return Response({'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+                         'end_time': end_time.strftime('%Y-%m-%d %H:%M:%S'), **heatmap})
+
+    # 订单导出：以流的形式导出订单及其菜品详情，支持csv（每个菜品详情一行）和ndjson（每个订单一行）两种格式，
+    # 可以和订单列表一样通过start_time、end_time、table_number过滤。
+    #
+    # 示例：GET /order/export/?type=csv&start_time=2024-01-01&end_time=2024-03-31
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request, *args, **kwargs):
+        export_type = request.query_params.get('type', 'csv')  # 默认为'csv'
+        if export_type == 'csv':
+            response = StreamingHttpResponse(stream_csv(self.get_queryset()), content_type='text/csv; charset=utf-8')
+        elif export_type == 'ndjson':
+            response = StreamingHttpResponse(stream_ndjson(self.get_queryset()),
+                                             content_type='application/x-ndjson; charset=utf-8')
+        else:
+            return Response({'msg': '无效的导出格式。'}, status=400)
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_type}"'
+        return response
+
+    # 一次性提交订单：在一个事务中创建订单及其全部菜品详情，订单总价只计算一次。
+    # 可以通过发送一个POST请求到/order/submit/来使用这个接口，请求体示例：
+    # {"table": 1, "number_of_people": 4, "dishes": [{"dish": 3, "quantity": 2}, {"dish": 5, "quantity": 1}]}
+    @action(detail=False, methods=['post'], url_path='submit')
+    def submit(self, request, *args, **kwargs):
+        serializer = OrderSubmitSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save()
+        order = Order.objects.prefetch_related(get_dish_detail_prefetch()).get(pk=order.pk)
+        return Response(self.get_serializer(order).data, status=status.HTTP_201_CREATED)
 
     # 重写retrieve方法。在返回响应之前，检查Order对象是否有相关的DishDetail对象，如果有，就更新total_amount
     # def retrieve(self, request, *args, **kwargs):
@@ -191,11 +567,52 @@ class OrderViewSet(viewsets.ModelViewSet):
 
 
 # 菜品详情表视图
-class DishDetailViewSet(viewsets.ModelViewSet):
-    queryset = DishDetail.objects.all().order_by('id')
+class DishDetailViewSet(ReplicaListMixin, OptionalCursorPaginationMixin, viewsets.ModelViewSet):
+    queryset = DishDetail.objects.order_by('id')
     serializer_class = DishDetailSerializer
+    cursor_pagination_class = DishDetailCursorPagination  # ?pagination=cursor时使用游标分页
     # permission_classes = [IsAuthenticated]
 
+    def get_ticket_cursor(self, request):
+        """
+        后厨单的游标：SSE重连时的Last-Event-ID请求头优先，其次是after参数，都没有时从当前最新的菜品详情开始。
+        """
+        after = request.headers.get('Last-Event-ID') or request.query_params.get('after')
+        if after is None:
+            return get_latest_ticket_id()
+        after = int(after)
+        if after < 0:
+            raise ValueError(after)
+        return after
+
+    # 后厨单长轮询：返回id大于after的菜品详情（菜品名称、单位、规格、桌号和数量），没有时最多等待timeout秒，
+    # 返回的cursor作为下一次请求的after，重连时不会重复也不会遗漏。
+    #
+    # 示例：GET /dish-detail/tickets/?after=120&timeout=25
+    @action(detail=False, methods=['get'], url_path='tickets')
+    def tickets(self, request, *args, **kwargs):
+        try:
+            after = self.get_ticket_cursor(request)
+            timeout = float(request.query_params.get('timeout', settings.KITCHEN_LONG_POLL_TIMEOUT))
+        except ValueError:
+            return Response({'msg': '无效的游标或等待时间。'}, status=400)
+        tickets = wait_for_tickets(after, max(0.0, min(timeout, settings.KITCHEN_LONG_POLL_TIMEOUT)))
+        return Response({'cursor': tickets[-1]['id'] if tickets else after, 'tickets': tickets})
+
+    # 后厨单推送（SSE）：每张新的后厨单是一条ticket事件，事件id是菜品详情的id，
+    # 浏览器中使用new EventSource('/api/dish-detail/tickets/stream/?after=120')，断线重连时自动从最后收到的id继续。
+    #
+    # 示例：GET /dish-detail/tickets/stream/?after=120
+    @action(detail=False, methods=['get'], url_path='tickets/stream',
+            renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def tickets_stream(self, request, *args, **kwargs):
+        try:
+            after = self.get_ticket_cursor(request)
+        except ValueError:
+            return Response({'msg': '无效的游标。'}, status=400)
+        fetch = ticket_messages(after)
+        return event_stream_response(request, kitchen_channel, snapshot=fetch, changes=fetch)
+
 
 # 员工表视图
 class EmployeeViewSet(viewsets.ModelViewSet):
@@ -205,13 +622,117 @@ class EmployeeViewSet(viewsets.ModelViewSet):
     # permission_classes = [IsAuthenticated]
 
     # 通过发送一个POST请求到/employees/delete-multiple/来使用
-    # 在请求的body中提供一个名为ids的数组，其中包含想要删除的所有员工的id
+    # 在请求的body中提供一个名为ids的数组，其中包含想要删除的所有员工的id，
+    # 用一条DELETE语句删除，返回删除的数量和不存在的id
     @action(detail=False, methods=['post'], url_path='delete-multiple')
     def delete_multiple(self, request, *args, **kwargs):
         ids = request.data.get('ids', [])
         if not ids:
             return Response({'msg': '没有提供要删除的员工ID。'}, status=400)
-        employees = get_list_or_404(Employee, id__in=ids)
-        for employee in employees:
-            employee.delete()
-        return Response({'status': 'success'})
+        try:
+            ids = [int(employee_id) for employee_id in ids]
+        except (TypeError, ValueError):
+            return Response({'msg': '无效的员工ID。'}, status=400)
+        existing = set(Employee.objects.filter(id__in=ids).values_list('id', flat=True))
+        missing = [employee_id for employee_id in ids if employee_id not in existing]
+        if not existing:
+            return Response({'msg': '没有找到要删除的员工。', 'missing': missing}, status=404)
+        deleted, _ = Employee.objects.filter(id__in=existing).delete()
+        return Response({'status': 'success', 'deleted': deleted, 'missing': missing})
+
+    # 批量创建员工：POST /employees/bulk-create/，请求体为员工数组，
+    # 整批数据校验通过后在一个事务中用bulk_create写入，任何一行有错误时都不写入
+    @action(detail=False, methods=['post'], url_path='bulk-create')
+    def bulk_create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list) or not request.data:
+            return Response({'msg': '没有提供要创建的员工。'}, status=400)
+        serializer = EmployeeBulkSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        employees = serializer.save()
+        return Response(EmployeeSerializer(employees, many=True).data, status=status.HTTP_201_CREATED)
+
+    # 批量更新员工：POST /employees/bulk-update/，请求体为员工数组，每个员工必须提供id，其余字段只更新提供的部分，
+    # 例如[{"id": 1, "position": "经理"}, {"id": 2, "is_resigned": true}]
+    @action(detail=False, methods=['post', 'patch'], url_path='bulk-update')
+    def bulk_update(self, request, *args, **kwargs):
+        if not isinstance(request.data, list) or not request.data:
+            return Response({'msg': '没有提供要更新的员工。'}, status=400)
+        ids = [item.get('id') if isinstance(item, dict) else None for item in request.data]
+        if not all(isinstance(employee_id, int) for employee_id in ids) or len(set(ids)) != len(ids):
+            return Response({'msg': '每个员工都需要提供不重复的id。'}, status=400)
+        employees = Employee.objects.in_bulk(ids)
+        missing = [employee_id for employee_id in ids if employee_id not in employees]
+        if missing:
+            return Response({'msg': '员工不存在。', 'missing': missing}, status=400)
+        serializer = EmployeeBulkSerializer([employees[employee_id] for employee_id in ids], data=request.data,
+                                            many=True, partial=True)
+        serializer.is_valid(raise_exception=True)
+        employees = serializer.save()
+        return Response(EmployeeSerializer(employees, many=True).data)
+
+    # 从CSV文件导入员工：POST /employees/import/，multipart上传file，表头为employee_number,name,gender,position，
+    # 可选is_resigned。整个文件校验通过后在一个事务中写入，有错误时返回出错的行号，不写入任何数据。
+    # upsert=true时工号已存在的员工按文件内容更新，否则视为错误。
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser, FormParser])
+    def import_csv(self, request, *args, **kwargs):
+        file = request.FILES.get('file')
+        if file is None:
+            return Response({'msg': '没有提供要导入的文件。'}, status=400)
+        upsert = str(request.data.get('upsert', request.query_params.get('upsert', ''))).lower() in ('1', 'true')
+        try:
+            reader = csv.DictReader(TextIOWrapper(file.file, encoding='utf-8-sig'))
+            missing_columns = set(EMPLOYEE_IMPORT_COLUMNS) - set(reader.fieldnames or [])
+            if missing_columns:
+                return Response({'msg': f'缺少列：{",".join(sorted(missing_columns))}。'}, status=400)
+            rows = [{key: value.strip() for key, value in row.items()
+                     if key in EMPLOYEE_IMPORT_COLUMNS + ['is_resigned'] and value is not None and value.strip()}
+                    for row in reader]
+        except (UnicodeDecodeError, csv.Error):
+            return Response({'msg': '无法解析CSV文件，请使用UTF-8编码。'}, status=400)
+        if not rows:
+            return Response({'msg': '文件中没有员工数据。'}, status=400)
+
+        serializer = EmployeeBulkSerializer(data=rows, many=True, context={'upsert': upsert})
+        if not serializer.is_valid():
+            # 第1行是表头，数据从第2行开始
+            errors = [{'row': index + 2, 'errors': error} for index, error in enumerate(serializer.errors) if error]
+            return Response({'msg': '导入失败，请修改以下行后重新导入。', 'errors': errors}, status=400)
+        existing = Employee.objects.filter(employee_number__in=[row['employee_number'] for row in rows]).count()
+        serializer.save()
+        return Response({'status': 'success', 'created': len(rows) - existing, 'updated': existing})
+
+
+# 统计接口缓存的命中情况：GET /analytics-cache/ 返回命中次数、未命中次数和当前数据版本号
+class AnalyticsCacheViewSet(viewsets.ViewSet):
+    # permission_classes = [IsAuthenticated]
+
+    def list(self, request, *args, **kwargs):
+        return Response(get_cache_stats())
+
+
+# 看板：一次请求返回看板需要的全部统计，菜品和订单的数据各只扫描一遍。
+# 可以通过发送一个GET请求到/dashboard/来使用这个接口，period可选'day'，'week'或'month'，
+# sections以逗号分隔指定需要的统计项，默认返回全部：dish_sales_rank（菜品销量排行）、category_sales_trend（分类销售趋势）、
+# total_amount_statistics（订单总价区间统计，支持buckets参数）、summary（营业额、订单数、就餐人数和客单价）。
+#
+# 示例：GET /dashboard/?period=week&sections=summary,dish_sales_rank
+class DashboardViewSet(viewsets.ViewSet):
+    # permission_classes = [IsAuthenticated]
+
+    @cached_analytics('dashboard')
+    @read_from_replica
+    def list(self, request, *args, **kwargs):
+        period = request.query_params.get('period', 'day')  # 默认为'day'
+        if period not in ['day', 'week', 'month']:
+            return Response({'msg': '无效的时间段。'}, status=400)
+        sections = request.query_params.get('sections')
+        sections = [section.strip() for section in sections.split(',') if section.strip()] if sections \
+            else DASHBOARD_SECTIONS
+        unknown = [section for section in sections if section not in DASHBOARD_SECTIONS]
+        if unknown:
+            return Response({'msg': f'无效的统计项：{",".join(unknown)}。'}, status=400)
+        try:
+            edges = get_total_amount_buckets(request.query_params.get('buckets'))
+        except ValueError as exc:
+            return Response({'msg': str(exc)}, status=400)
+        return Response(get_dashboard(period, sections, edges))
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    authentication.py
+# @Time:    2024/03/27
+"""
+带缓存的JWT认证
+
+与JWTAuthentication相同，只是用户（连同用户资料userprofile）优先从缓存中读取，缓存见cache.py。
+用户被禁用（is_active=False）时保存会使缓存失效，之后的请求同样返回用户已禁用。
+缓存不在进程间共享（本地内存缓存）时不缓存用户，与JWTAuthentication一样每个请求查询数据库。
+"""
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import get_cache, is_shared_cache, make_user_cache_key
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def load_user(self, user_id):
+        try:
+            return self.user_model.objects.select_related('userprofile').get(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        cache = get_cache()
+        if is_shared_cache(cache):
+            key = make_user_cache_key(user_id, validated_token.get(api_settings.JTI_CLAIM) or validated_token.token)
+            user = cache.get(key)
+            if user is None:
+                user = self.load_user(user_id)
+                cache.set(key, user, timeout=getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 300))
+        else:
+            user = self.load_user(user_id)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        return user
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    cache.py
+# @Time:    2024/03/27
+"""
+JWT认证用户的缓存
+
+每个请求通过JWT认证时都要按主键查询一次User，序列化时还要再查询一次UserProfile。
+这里把用户连同用户资料缓存起来，缓存键包含用户id、该用户的版本号和token的jti，
+User或UserProfile保存、删除时在事务提交后删除版本号，该用户所有token的缓存一起失效。
+
+失效只对同一个缓存有效：本地内存缓存（LocMemCache）每个进程各有一份，一个进程中禁用用户或修改密码后，
+其他进程仍会读到旧的用户。所以AUTH_USER_CACHE_ALIAS使用本地内存缓存时不缓存用户，每个请求都从数据库读取，
+多进程部署时需要配置文件缓存、Redis等进程间共享的缓存才能启用，manage.py check --deploy会对此给出警告。
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+
+def get_cache():
+    return caches[getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')]
+
+
+def is_shared_cache(cache):
+    """
+    缓存是否在进程间共享，本地内存缓存只在当前进程内有效。
+    """
+    return not isinstance(cache, LocMemCache)
+
+
+def get_user_version(user_id):
+    """
+    返回用户的版本号，不存在时以当前时间（纳秒）初始化，与之前删除的版本号不会重复。
+    """
+    cache = get_cache()
+    key = f'auth-user-version:{user_id}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key, 0)
+    return version
+
+
+def make_user_cache_key(user_id, token_id):
+    digest = hashlib.md5(str(token_id).encode('utf-8')).hexdigest()
+    return f'auth-user:{user_id}:{get_user_version(user_id)}:{digest}'
+
+
+def invalidate_user(user_id):
+    """
+    在当前事务提交后使用户的缓存失效。
+    """
+    transaction.on_commit(lambda: get_cache().delete(f'auth-user-version:{user_id}'))
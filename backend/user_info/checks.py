@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Author:  HUHU
+# @File:    checks.py
+# @Time:    2024/03/27
+"""
+部署检查：JWT认证用户的缓存需要在进程间共享，见cache.py
+"""
+from django.core import checks
+
+from .cache import get_cache, is_shared_cache
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_auth_user_cache(app_configs, **kwargs):
+    if is_shared_cache(get_cache()):
+        return []
+    return [checks.Warning(
+        'AUTH_USER_CACHE_ALIAS使用的是本地内存缓存，认证用户不会被缓存，每个请求都查询数据库。',
+        hint='多进程部署时请为该缓存配置文件缓存、Redis等进程间共享的缓存后端。',
+        id='user_info.W001',
+    )]
@@ -2,6 +2,10 @@
 
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_user
 
 
 # Creating a Profile model that has a one-to-one relationship with the User model
@@ -16,3 +20,14 @@ class UserProfile(models.Model):
     # String representation of the Profile model
     def __str__(self):
         return self.user.username
+
+
+# 用户或用户资料变化时，使JWT认证缓存的该用户失效
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_cached_user_profile(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
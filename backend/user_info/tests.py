@@ -1,3 +1,92 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.test import override_settings
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .checks import check_auth_user_cache
+from .models import UserProfile
+
+
+# JWT认证用户缓存测试
+class CachedJWTAuthenticationTests(APITestCase):
+    url = '/api/analytics-cache/'  # 本身不查询数据库的接口
+
+    def setUp(self):
+        # 用户缓存使用进程间共享的文件缓存
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.enterContext(override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'auth': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory},
+        }, AUTH_USER_CACHE_ALIAS='auth'))
+        cache.clear()
+        self.user = User.objects.create_user('waiter', password='secret')
+        UserProfile.objects.create(user=self.user, gender='女', occupation='服务员')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_user_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_profile_loaded_with_user(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.wsgi_request.user.userprofile.occupation, '服务员')
+
+    def test_invalidated_on_save(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = True
+            self.user.save()
+            self.user.userprofile.occupation = '经理'
+            self.user.userprofile.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.wsgi_request.user.userprofile.occupation, '经理')
+
+    def test_invalidated_from_other_process(self):
+        self.client.get(self.url)
+        # 另一个进程中的缓存实例删除版本号，本进程之后的请求同样读到新的用户
+        other = caches.create_connection('auth')
+        self.assertIsNot(other, caches['auth'])
+        with mock.patch('user_info.cache.get_cache', return_value=other):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.is_active = False
+                self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_local_memory_cache_not_used(self):
+        # 本地内存缓存无法在进程间失效，不缓存用户，部署检查给出警告
+        self.assertEqual(check_auth_user_cache(None), [])
+        with override_settings(AUTH_USER_CACHE_ALIAS='default'):
+            self.assertEqual([warning.id for warning in check_auth_user_cache(None)], ['user_info.W001'])
+            for _ in range(2):
+                with self.assertNumQueries(1):
+                    self.assertEqual(self.client.get(self.url).status_code, 200)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.is_active = False
+                self.user.save()
+            self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_deleted_user(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_invalid_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer invalid')
+        self.assertEqual(self.client.get(self.url).status_code, 401)
@@ -18,7 +18,7 @@ from .serializers import UserSerializer
 # Creating a viewset that inherits from ModelViewSet
 class UserInfoViewSet(viewsets.ModelViewSet):
     # Specifying the queryset for the viewset (all User objects)
-    queryset = User.objects.all().order_by('-date_joined')
+    queryset = User.objects.select_related('userprofile').order_by('-date_joined')
     # Specifying the serializer class to be used
     serializer_class = UserSerializer
 